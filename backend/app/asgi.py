@@ -0,0 +1,246 @@
+"""
+ASGI serving mode for the AI-bound endpoints.
+
+Under gunicorn every request holds a worker thread for the whole 2–10 s Gemini round trip. In this
+mode the four AI endpoints run as coroutines that await the SDKs' non-blocking calls, so one
+process can keep thousands of requests in flight:
+
+- POST /api/analyze          -> analyze_budget_async
+- POST /api/grade-quiz       -> grade_quiz_answer_async
+- POST /api/chat             -> GeminiStudioClient.generate_content_async
+- POST /api/glossary/explain -> GeminiStudioClient.generate_content_async
+
+Everything else (health, glossary lookups, demo, CORS preflight, legacy form posts, malformed
+JSON) is handed to the normal Flask app through asgiref's WSGI adapter, so request and response
+contracts are identical in both modes. CORS headers on the async routes come from the Flask app's
+own flask-cors setup. Blocking work on the async routes (SDK setup, SQLite caches, validation and
+pre-grading) runs on worker threads so a cold start or a slow disk never stalls the event loop.
+
+Run (from backend/):
+    uvicorn --factory main:create_asgi_app --port 5001
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask
+
+from app.routes.budget import ANALYZE_FAILED, GRADING_FAILED, _budget_from_data, _grade_fields
+from app.routes.chat import CHAT_CONFIG, CHAT_MODEL, _chat_request, _fallback_reply
+from app.routes.glossary import (
+    EXPLAIN_CONFIG,
+    EXPLAIN_MODEL,
+    _explain_body,
+    _explain_request,
+    _fallback_explanation,
+    _remember_explanation,
+    _stored_explanation,
+)
+from app.services import ai_service
+from app.services.deadlines import endpoint_deadline
+from app.services.metrics import RequestTimer
+from app.services.tracing import discard_trace, finish_trace, server_timing_enabled, span, start_trace
+
+Result = Tuple[Dict[str, Any], int]
+
+# Routes that get a per-stage trace and Server-Timing header, as in the Flask app
+TRACED_ROUTES = {'/api/analyze': 'analyze'}
+
+
+async def _analyze(data: Dict[str, Any]) -> Result:
+    with span('validate'):
+        budget_input, error = await asyncio.to_thread(_budget_from_data, data)
+    if error is not None:
+        return error
+    try:
+        return await ai_service.analyze_budget_async(budget_input), 200
+    except Exception as e:
+        print(f"Error analyzing budget: {str(e)}")
+        return ANALYZE_FAILED, 500
+
+
+async def _grade_quiz(data: Dict[str, Any]) -> Result:
+    fields, error = _grade_fields(data)
+    if error is not None:
+        return error
+    try:
+        return await ai_service.grade_quiz_answer_async(*fields), 200
+    except ValueError as e:
+        return {'error': 'Invalid input', 'message': str(e)}, 400
+    except Exception as e:
+        print(f"Error grading quiz: {e}")
+        return GRADING_FAILED, 500
+
+
+async def _chat(data: Dict[str, Any]) -> Result:
+    if not ai_service.GENAI_STUDIO_AVAILABLE:
+        return {'error': 'unavailable', 'message': 'Chatbot is currently unavailable.'}, 503
+    fields, error = _chat_request(data)
+    if error is not None:
+        return error
+    monthly_income, prompt = fields
+    with RequestTimer('chat') as req:
+        try:
+            deadline = endpoint_deadline('chat')
+            response = await asyncio.wait_for(
+                ai_service.get_gemini_client('chat').models.generate_content_async(
+                    model=CHAT_MODEL,
+                    contents=prompt,
+                    config=CHAT_CONFIG,
+                    timeout=deadline,
+                ),
+                deadline,
+            )
+            req.source = 'google_ai_studio'
+            return {'reply': (response.text or '').strip()}, 200
+        except Exception as e:
+            print(f"Chatbot error (falling back to rule-based reply): {e}")
+            req.source = 'fallback_deterministic'
+            return {'reply': _fallback_reply(monthly_income)}, 200
+
+
+async def _explain(data: Dict[str, Any]) -> Result:
+    fields, error = await asyncio.to_thread(_explain_request, data)
+    if error is not None:
+        return error
+    term, complexity, custom_prompt, entry, prompt = fields
+    with RequestTimer('explain') as req:
+        stored = await asyncio.to_thread(_stored_explanation, term, complexity, custom_prompt, entry, prompt)
+        if stored is not None:
+            req.source = 'store'
+            return stored, 200
+        if not ai_service.GENAI_STUDIO_AVAILABLE:
+            req.source = 'unavailable'
+            return {'error': 'unavailable', 'message': 'AI explanations are currently unavailable.'}, 503
+        try:
+            deadline = endpoint_deadline('explain')
+            response = await asyncio.wait_for(
+                ai_service.get_gemini_client('explain').models.generate_content_async(
+                    model=EXPLAIN_MODEL,
+                    contents=prompt,
+                    config=EXPLAIN_CONFIG,
+                    timeout=deadline,
+                ),
+                deadline,
+            )
+            explanation = (response.text or "").strip()
+            await asyncio.to_thread(_remember_explanation, complexity, custom_prompt, entry, explanation)
+            req.source = 'google_ai_studio'
+        except Exception as e:
+            print(f"Glossary AI explanation error (fallback to rule-based): {type(e).__name__}: {e}")
+            explanation = _fallback_explanation(term, entry, custom_prompt)
+            req.source = 'fallback_deterministic'
+    return _explain_body(term, complexity, entry, explanation, False), 200
+
+
+ASYNC_ROUTES: Dict[str, Callable[[Dict[str, Any]], Awaitable[Result]]] = {
+    '/api/analyze': _analyze,
+    '/api/grade-quiz': _grade_quiz,
+    '/api/chat': _chat,
+    '/api/glossary/explain': _explain,
+}
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _is_json(content_type: Optional[str]) -> bool:
+    """Same rule as Flask's request.is_json."""
+    mimetype = (content_type or "").split(";", 1)[0].strip().lower()
+    return mimetype == "application/json" or (
+        mimetype.startswith("application/") and mimetype.endswith("+json")
+    )
+
+
+class AsyncAIApp:
+    """ASGI app: native coroutines for ASYNC_ROUTES, the Flask app for everything else."""
+
+    def __init__(self, flask_app: Flask) -> None:
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.wsgi(scope, receive, send)
+            return
+        path = scope["path"].rstrip("/") or "/"
+        handler = ASYNC_ROUTES.get(path)
+        if handler is None or not _is_json(_header(scope, b"content-type")):
+            await self.wsgi(scope, receive, send)
+            return
+
+        trace = start_trace(TRACED_ROUTES[path]) if path in TRACED_ROUTES else None
+        with span("parse_payload"):
+            body = await self._read_body(receive)
+            try:
+                data = json.loads(body) if body else None
+            except ValueError:
+                data = None
+        if not isinstance(data, dict):
+            if trace is not None:
+                discard_trace(trace)
+            # Let Flask produce its exact error response for malformed / non-object bodies
+            await self.wsgi(scope, self._replay(body, receive), send)
+            return
+
+        payload, status = await handler(data)
+        await self._send_json(scope, send, payload, status, trace)
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    @staticmethod
+    def _replay(body: bytes, receive):
+        """A receive() that hands the already-read body to the WSGI adapter first."""
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return replay
+
+    def _cors_headers(self, scope) -> List[Tuple[bytes, bytes]]:
+        """The CORS headers the Flask app's own policy (flask-cors, see main.py) adds to this request."""
+        origin = _header(scope, b"origin")
+        if origin is None:
+            return []
+        with self.flask_app.test_request_context(scope["path"], method=scope["method"], headers={"Origin": origin}):
+            response = self.flask_app.process_response(self.flask_app.response_class())
+        return [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in response.headers.items()
+            if name.lower().startswith("access-control-") or name.lower() == "vary"
+        ]
+
+    async def _send_json(self, scope, send, payload: Dict[str, Any], status: int, trace=None) -> None:
+        with span("serialize"):
+            # Serialize with Flask's JSON provider so bodies match jsonify() byte for byte
+            body = f"{self.flask_app.json.dumps(payload)}\n".encode("utf-8")
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ]
+        if trace is not None:
+            trace.attributes["output_source"] = "cache" if payload.get("cache_hit") else payload.get("output_source")
+            finish_trace(trace, status)
+            if server_timing_enabled():
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+        headers += self._cors_headers(scope)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
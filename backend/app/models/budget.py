@@ -11,8 +11,10 @@ TODO:
 ============================================
 """
 
-from dataclasses import dataclass
-from typing import Dict, Any
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional
+
+from app.models.metrics import BudgetMetrics, compute_metrics
 
 
 @dataclass
@@ -21,26 +23,37 @@ class BudgetInput:
     monthly_income: float
     expenses: Dict[str, float]
     goal: str = "general"  # Options: "general", "emergency_fund", "debt_payoff", "big_purchase"
+    _metrics: Optional[BudgetMetrics] = field(default=None, init=False, repr=False, compare=False)
     
+    @property
+    def metrics(self) -> BudgetMetrics:
+        """
+        Totals, percentages, sorted breakdown and rule flags, computed once per budget.
+        Treat the budget as read-only once this has been accessed.
+        """
+        if self._metrics is None:
+            self._metrics = compute_metrics(self.monthly_income, self.expenses)
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, value: BudgetMetrics) -> None:
+        """Use metrics computed elsewhere (e.g. a BudgetMetricsBatch row) for this budget."""
+        self._metrics = value
+
     @property
     def total_expenses(self) -> float:
         """Calculate total expenses."""
-        return sum(self.expenses.values())
+        return self.metrics.total_expenses
     
     @property
     def remaining(self) -> float:
         """Calculate remaining income after expenses."""
-        return self.monthly_income - self.total_expenses
+        return self.metrics.remaining
     
     @property
     def expense_percentages(self) -> Dict[str, float]:
         """Calculate percentage of income for each expense category."""
-        if self.monthly_income == 0:
-            return {k: 0 for k in self.expenses}
-        return {
-            category: (amount / self.monthly_income) * 100
-            for category, amount in self.expenses.items()
-        }
+        return dict(self.metrics.percentages)
 
 
 def validate_budget_input(data: Dict[str, Any]) -> Dict[str, Any]:
@@ -0,0 +1,258 @@
+"""
+Budget metrics computed once per budget.
+
+`build_budget_prompt`, `parse_ai_response` and `generate_fallback_response` all need the same
+totals, percentages and rule flags. `BudgetMetrics` holds them so each request computes them a
+single time (`BudgetInput.metrics`). `BudgetMetricsBatch` computes the same numbers for N budgets
+as NumPy column arrays, for the batch endpoint and analytics.
+
+Category groups for the 50/30/20 split follow docs/financial_rules.md: housing, food,
+transportation, utilities and similar essentials are needs; `savings` is savings; everything
+else counts as wants.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    np = None  # type: ignore
+
+NEEDS_CATEGORIES = frozenset({
+    "rent",
+    "housing",
+    "mortgage",
+    "food",
+    "groceries",
+    "transportation",
+    "utilities",
+    "insurance",
+    "healthcare",
+    "childcare",
+    "debt",
+    "debt_payments",
+})
+SAVINGS_CATEGORY = "savings"
+HOUSING_CATEGORY = "rent"
+
+LOW_INCOME_THRESHOLD = 2000
+
+
+@dataclass(frozen=True)
+class BudgetMetrics:
+    """Everything the prompt, parser and fallback derive from a budget's numbers."""
+    monthly_income: float
+    total_expenses: float
+    remaining: float
+    # category -> % of income (0 for every category when income is 0)
+    percentages: Dict[str, float]
+    # (category, amount), largest first; ties keep input order
+    sorted_expenses: Tuple[Tuple[str, Any], ...]
+    # [{"category", "amount", "percentage"}] as returned in API responses
+    breakdown: Tuple[Dict[str, Any], ...]
+    savings: float
+    savings_pct: float
+    housing: float
+    housing_pct: float
+    needs: float
+    wants: float
+    needs_pct: float
+    wants_pct: float
+    is_zero_income: bool
+    is_overspending: bool
+    is_low_income: bool
+    is_high_saver: bool
+    is_low_saver: bool
+    is_housing_over_30: bool
+    is_needs_over_50: bool
+    is_wants_over_30: bool
+
+    def breakdown_rows(self) -> List[Dict[str, Any]]:
+        """Fresh copies of the breakdown rows, safe to put in a response dict."""
+        return [dict(row) for row in self.breakdown]
+
+
+def _pct(amount, income) -> float:
+    return (amount / income * 100) if income > 0 else 0
+
+
+def _display_category(category: str) -> str:
+    return category.replace("_", " ").title()
+
+
+def compute_metrics(monthly_income: float, expenses: Dict[str, Any]) -> BudgetMetrics:
+    """Single pass over the expenses; see BudgetInput.metrics."""
+    total = 0
+    needs = 0
+    wants = 0
+    for category, amount in expenses.items():
+        total += amount
+        if category in NEEDS_CATEGORIES:
+            needs += amount
+        elif category != SAVINGS_CATEGORY:
+            wants += amount
+    income = monthly_income
+    remaining = income - total
+
+    if income == 0:
+        percentages = {k: 0 for k in expenses}
+    else:
+        percentages = {k: (v / income) * 100 for k, v in expenses.items()}
+
+    sorted_expenses = tuple(sorted(expenses.items(), key=lambda x: x[1], reverse=True))
+    breakdown = tuple(
+        {
+            "category": _display_category(category),
+            "amount": amount,
+            "percentage": round(_pct(amount, income), 1),
+        }
+        for category, amount in sorted_expenses
+    )
+
+    savings = expenses.get(SAVINGS_CATEGORY, 0)
+    savings_pct = _pct(savings, income)
+    housing = expenses.get(HOUSING_CATEGORY, 0)
+    housing_pct = _pct(housing, income)
+    needs_pct = _pct(needs, income)
+    wants_pct = _pct(wants, income)
+
+    return BudgetMetrics(
+        monthly_income=income,
+        total_expenses=total,
+        remaining=remaining,
+        percentages=percentages,
+        sorted_expenses=sorted_expenses,
+        breakdown=breakdown,
+        savings=savings,
+        savings_pct=savings_pct,
+        housing=housing,
+        housing_pct=housing_pct,
+        needs=needs,
+        wants=wants,
+        needs_pct=needs_pct,
+        wants_pct=wants_pct,
+        is_zero_income=income == 0,
+        is_overspending=remaining < 0,
+        is_low_income=income < LOW_INCOME_THRESHOLD,
+        is_high_saver=savings_pct >= 20,
+        is_low_saver=0 <= savings_pct < 10,
+        is_housing_over_30=housing_pct > 30,
+        is_needs_over_50=needs_pct > 50,
+        is_wants_over_30=wants_pct > 30,
+    )
+
+
+class BudgetMetricsBatch:
+    """
+    The BudgetMetrics scalars for N budgets as NumPy column arrays (index i = budget i).
+
+    Expenses are flattened into (row, category, amount) arrays and reduced with bincount, so the
+    cost is one pass over all expense lines regardless of how categories vary between budgets.
+    Requires numpy (see NUMPY_AVAILABLE).
+    """
+
+    SCALAR_COLUMNS = (
+        "monthly_income", "total_expenses", "remaining", "savings", "savings_pct",
+        "housing", "housing_pct", "needs", "wants", "needs_pct", "wants_pct",
+    )
+    FLAG_COLUMNS = (
+        "is_zero_income", "is_overspending", "is_low_income", "is_high_saver", "is_low_saver",
+        "is_housing_over_30", "is_needs_over_50", "is_wants_over_30",
+    )
+
+    def __init__(self, incomes: Sequence[float], expenses: Sequence[Dict[str, Any]]) -> None:
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is not installed (pip install numpy)")
+        n = len(incomes)
+        self.size = n
+        self._expenses = list(expenses)
+        lengths = np.fromiter((len(e) for e in self._expenses), dtype=np.int64, count=n)
+        self._offsets = np.concatenate(([0], np.cumsum(lengths)))
+        self.row_ids = np.repeat(np.arange(n), lengths)
+        self.categories: List[str] = [c for e in self._expenses for c in e]
+        self.amounts = np.fromiter(
+            (float(v) for e in self._expenses for v in e.values()), dtype=np.float64, count=int(lengths.sum())
+        )
+        is_need = np.fromiter((c in NEEDS_CATEGORIES for c in self.categories), dtype=bool, count=len(self.categories))
+        is_savings = np.fromiter((c == SAVINGS_CATEGORY for c in self.categories), dtype=bool, count=len(self.categories))
+        is_housing = np.fromiter((c == HOUSING_CATEGORY for c in self.categories), dtype=bool, count=len(self.categories))
+
+        def per_row(mask=None):
+            weights = self.amounts if mask is None else np.where(mask, self.amounts, 0.0)
+            return np.bincount(self.row_ids, weights=weights, minlength=n)
+
+        income = np.asarray(incomes, dtype=np.float64)
+        positive = income > 0
+        safe_income = np.where(positive, income, 1.0)
+
+        def pct(values):
+            return np.where(positive, values / safe_income * 100, 0.0)
+
+        self.monthly_income = income
+        self.total_expenses = per_row()
+        self.remaining = income - self.total_expenses
+        self.savings = per_row(is_savings)
+        self.housing = per_row(is_housing)
+        self.needs = per_row(is_need)
+        self.wants = per_row(~is_need & ~is_savings)
+        self.savings_pct = pct(self.savings)
+        self.housing_pct = pct(self.housing)
+        self.needs_pct = pct(self.needs)
+        self.wants_pct = pct(self.wants)
+        # Per expense line: % of its budget's income (0 when income is 0), as in BudgetMetrics
+        nonzero = income != 0
+        line_income = np.where(nonzero, income, 1.0)[self.row_ids]
+        self.line_percentages = np.where(nonzero[self.row_ids], self.amounts / line_income * 100, 0.0)
+
+        self.is_zero_income = income == 0
+        self.is_overspending = self.remaining < 0
+        self.is_low_income = income < LOW_INCOME_THRESHOLD
+        self.is_high_saver = self.savings_pct >= 20
+        self.is_low_saver = (self.savings_pct >= 0) & (self.savings_pct < 10)
+        self.is_housing_over_30 = self.housing_pct > 30
+        self.is_needs_over_50 = self.needs_pct > 50
+        self.is_wants_over_30 = self.wants_pct > 30
+
+    @classmethod
+    def from_budgets(cls, budgets: Sequence[Any]) -> "BudgetMetricsBatch":
+        """Build from BudgetInput-like objects (monthly_income, expenses)."""
+        return cls([b.monthly_income for b in budgets], [b.expenses for b in budgets])
+
+    def columns(self) -> Dict[str, Any]:
+        """All scalar and flag columns by name (analytics export)."""
+        return {name: getattr(self, name) for name in self.SCALAR_COLUMNS + self.FLAG_COLUMNS}
+
+    def metrics(self, i: int) -> BudgetMetrics:
+        """
+        Row i as a BudgetMetrics, reading totals and flags from the column arrays. Breakdown rows
+        keep the budget's original amounts so API output matches compute_metrics.
+        """
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        expenses = self._expenses[i]
+        items = list(expenses.items())
+        income = float(self.monthly_income[i])
+        line_pct = self.line_percentages[start:end].tolist()
+        # Stable descending sort == sorted(..., key=amount, reverse=True)
+        order = np.argsort(-self.amounts[start:end], kind="stable").tolist()
+        sorted_expenses = tuple(items[j] for j in order)
+        breakdown = tuple(
+            {
+                "category": _display_category(items[j][0]),
+                "amount": items[j][1],
+                "percentage": round(line_pct[j], 1) if income > 0 else 0,
+            }
+            for j in order
+        )
+        row = {name: getattr(self, name)[i].item() for name in self.SCALAR_COLUMNS + self.FLAG_COLUMNS}
+        return BudgetMetrics(
+            percentages={k: (line_pct[j] if income != 0 else 0) for j, (k, _v) in enumerate(items)},
+            sorted_expenses=sorted_expenses,
+            breakdown=breakdown,
+            **row,
+        )
+
+    def all_metrics(self) -> List[BudgetMetrics]:
+        return [self.metrics(i) for i in range(self.size)]
@@ -1,13 +1,28 @@
 """
 Budget API routes — POST /api/analyze (budget JSON) and POST /api/grade-quiz (quiz grading JSON).
+POST /api/analyze/stream is the Server-Sent Events variant of /api/analyze.
+POST /api/analyze/batch analyzes a whole cohort of budgets in one request.
+POST /api/grade-quiz/batch grades a whole class's answers to one quiz question.
 
 Teammate task (documentation): keep README, docs/milestone2_demo.md, and docs/prompt_design.md aligned
 with these two endpoints and the three-step UI (quiz, AI verdict, then explanation and tip).
 """
 import json
+import os
+from functools import lru_cache
 from flask import Blueprint, request, jsonify
-from app.services.ai_service import analyze_budget, grade_quiz_answer
+from app.services.ai_service import (
+    analyze_budget,
+    analyze_budget_batch,
+    grade_quiz_answer,
+    grade_quiz_answers_batch,
+    stream_budget_analysis,
+)
+from app.routes.http_cache import CachedBody, cached_json_response
+from app.routes.server_timing import traced
+from app.routes.streaming import ndjson_response, sse_event, sse_response
 from app.models.budget import BudgetInput, validate_budget_input
+from app.services.tracing import set_attribute, span
 
 budget_bp = Blueprint('budget', __name__)
 
@@ -29,7 +44,76 @@ def _parse_budget_payload():
     return None, None
 
 
+def _budget_from_data(data, form_err=None):
+    """
+    Validate a parsed payload. Returns (BudgetInput, None) or (None, (error_body, status)).
+    Shared by the Flask route and the ASGI serving mode (app/asgi.py).
+    """
+    if data is None:
+        msg = (
+            'Send JSON: {"monthly_income": number, "expenses": {...}, "goal": "general"}'
+            if form_err is None
+            else f'Invalid form data: {form_err}'
+        )
+        return None, ({'error': 'Invalid request', 'message': msg}, 400)
+
+    if not data:
+        return None, ({
+            'error': 'No data provided',
+            'message': 'Please provide budget data as JSON'
+        }, 400)
+
+    validation_result = validate_budget_input(data)
+    if not validation_result['valid']:
+        return None, ({
+            'error': 'Invalid input',
+            'message': validation_result['message']
+        }, 400)
+
+    # Validation accepts numeric strings ("1500"); everything downstream does arithmetic on amounts
+    expenses = {
+        str(category): amount if isinstance(amount, (int, float)) and not isinstance(amount, bool) else float(amount)
+        for category, amount in data.get('expenses', {}).items()
+    }
+    return BudgetInput(
+        monthly_income=float(data.get('monthly_income', 0)),
+        expenses=expenses,
+        goal=data.get('goal', 'general')
+    ), None
+
+
+def _grade_fields(data):
+    """Returns ((question, key, answer), None) or (None, (error_body, status))."""
+    if not isinstance(data, dict):
+        return None, ({'error': 'Invalid request', 'message': 'Send JSON body'}, 400)
+
+    q = (data.get('quiz_question') or '').strip()
+    key = (data.get('quiz_answer_key') or '').strip()
+    ans = (data.get('user_answer') or '').strip()
+
+    if not q:
+        return None, ({'error': 'Invalid input', 'message': 'quiz_question is required'}, 400)
+    if not ans:
+        return None, ({
+            'error': 'Invalid input',
+            'message': 'Please enter an answer before submitting for grading.',
+        }, 400)
+    return (q, key, ans), None
+
+
+ANALYZE_FAILED = {
+    'error': 'Analysis failed',
+    'message': 'An error occurred while analyzing your budget. Please try again.'
+}
+
+GRADING_FAILED = {
+    'error': 'Grading failed',
+    'message': 'Could not grade this answer. Please try again.',
+}
+
+
 @budget_bp.route('/analyze', methods=['POST'])
+@traced('analyze')
 def analyze_budget_endpoint():
     """
     Analyze a user's budget. Frontend sends JSON:
@@ -38,45 +122,145 @@ def analyze_budget_endpoint():
         "expenses": { "rent": 1200, ... },
         "goal": "general"
     }
+    The Server-Timing header breaks the request down by stage (see app/services/tracing.py).
     """
     try:
-        data, form_err = _parse_budget_payload()
-        if data is None:
-            msg = (
-                'Send JSON: {"monthly_income": number, "expenses": {...}, "goal": "general"}'
-                if form_err is None
-                else f'Invalid form data: {form_err}'
-            )
-            return jsonify({'error': 'Invalid request', 'message': msg}), 400
-
-        if not data:
-            return jsonify({
-                'error': 'No data provided',
-                'message': 'Please provide budget data as JSON'
-            }), 400
-
-        validation_result = validate_budget_input(data)
-        if not validation_result['valid']:
-            return jsonify({
-                'error': 'Invalid input',
-                'message': validation_result['message']
-            }), 400
-
-        budget_input = BudgetInput(
-            monthly_income=float(data.get('monthly_income', 0)),
-            expenses=data.get('expenses', {}),
-            goal=data.get('goal', 'general')
-        )
+        with span('parse_payload'):
+            data, form_err = _parse_budget_payload()
+        with span('validate'):
+            budget_input, error = _budget_from_data(data, form_err)
+        if error is not None:
+            body, status = error
+            return jsonify(body), status
 
         result = analyze_budget(budget_input)
-        return jsonify(result), 200
+        set_attribute('output_source', 'cache' if result.get('cache_hit') else result.get('output_source'))
+        with span('serialize'):
+            response = jsonify(result)
+        return response, 200
 
     except Exception as e:
         print(f"Error analyzing budget: {str(e)}")
+        return jsonify(ANALYZE_FAILED), 500
+
+
+@budget_bp.route('/analyze/stream', methods=['POST'])
+def analyze_budget_stream_endpoint():
+    """
+    Same request body as POST /api/analyze, answered as Server-Sent Events (text/event-stream):
+
+    event: summary  -> {"breakdown": [...], "insights": [...], "goal": "..."}   (immediately)
+    event: section  -> {"section": "FINANCIAL ADVICE", "field": "financial_advice", "value": ...}
+    event: result   -> full analyze response (same JSON as POST /api/analyze)
+    event: done     -> {}
+
+    Validation errors are returned as normal JSON 400s before the stream starts.
+    """
+    data, form_err = _parse_budget_payload()
+    budget_input, error = _budget_from_data(data, form_err)
+    if error is not None:
+        body, status = error
+        return jsonify(body), status
+
+    def events():
+        try:
+            for event, payload in stream_budget_analysis(budget_input):
+                yield sse_event(event, payload)
+        except Exception as e:
+            print(f"Error streaming budget analysis: {str(e)}")
+            yield sse_event('error', ANALYZE_FAILED)
+        yield sse_event('done', {})
+
+    return sse_response(events())
+
+
+def _batch_payloads():
+    """
+    Read a JSON array or NDJSON (one budget object per line) body.
+    Returns (payloads, None) or (None, error message). Unparseable NDJSON lines become None.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines'):
+        payloads = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                payloads.append(json.loads(line))
+            except json.JSONDecodeError:
+                payloads.append(None)
+        return payloads, None
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        return None, 'Send a JSON array of budgets, or NDJSON with one budget object per line'
+    return data, None
+
+
+def _batch_line(index, result):
+    """One NDJSON line; analyze_budget_batch reports an item it could not analyze as an exception."""
+    if isinstance(result, Exception):
+        return {'index': index, 'status': 500, **ANALYZE_FAILED}
+    return {'index': index, 'status': 200, 'result': result}
+
+
+@budget_bp.route('/analyze/batch', methods=['POST'])
+def analyze_budget_batch_endpoint():
+    """
+    Analyze many budgets (e.g. a class cohort) in one request.
+
+    Body: JSON array of /api/analyze payloads, or NDJSON (Content-Type: application/x-ndjson).
+    Query: order=input (default) or order=completed (stream results as they finish).
+
+    Response is NDJSON, one line per budget:
+    {"index": 0, "status": 200, "result": {...same as /api/analyze...}}
+    {"index": 1, "status": 400, "error": "Invalid input", "message": "..."}
+    """
+    payloads, message = _batch_payloads()
+    if payloads is None:
+        return jsonify({'error': 'Invalid request', 'message': message}), 400
+    if not payloads:
+        return jsonify({'error': 'No data provided', 'message': 'Send at least one budget'}), 400
+    max_items = int(os.getenv('ANALYZE_BATCH_MAX_ITEMS', '500'))
+    if len(payloads) > max_items:
         return jsonify({
-            'error': 'Analysis failed',
-            'message': 'An error occurred while analyzing your budget. Please try again.'
-        }), 500
+            'error': 'Invalid request',
+            'message': f'At most {max_items} budgets per batch (got {len(payloads)})',
+        }), 400
+
+    errors = {}
+    valid_indices = []
+    budgets = []
+    for index, payload in enumerate(payloads):
+        budget_input, error = _budget_from_data(payload if isinstance(payload, dict) else None)
+        if error is not None:
+            body, status = error
+            errors[index] = {'index': index, 'status': status, **body}
+        else:
+            valid_indices.append(index)
+            budgets.append(budget_input)
+
+    ordered = request.args.get('order', 'input') != 'completed'
+
+    def lines():
+        results = analyze_budget_batch(budgets, ordered=ordered)
+        try:
+            if ordered:
+                for index in range(len(payloads)):
+                    if index in errors:
+                        yield errors[index]
+                    else:
+                        _pos, result = next(results)
+                        yield _batch_line(index, result)
+            else:
+                yield from errors.values()
+                for pos, result in results:
+                    yield _batch_line(valid_indices[pos], result)
+        except Exception as e:
+            print(f"Error in batch analysis: {str(e)}")
+            yield {'status': 500, **ANALYZE_FAILED}
+        finally:
+            results.close()
+
+    return ndjson_response(lines())
 
 
 @budget_bp.route('/grade-quiz', methods=['POST'])
@@ -92,32 +276,79 @@ def grade_quiz_endpoint():
     }
     """
     try:
-        data = request.get_json(silent=True)
-        if not isinstance(data, dict):
-            return jsonify({'error': 'Invalid request', 'message': 'Send JSON body'}), 400
-
-        q = (data.get('quiz_question') or '').strip()
-        key = (data.get('quiz_answer_key') or '').strip()
-        ans = (data.get('user_answer') or '').strip()
-
-        if not q:
-            return jsonify({'error': 'Invalid input', 'message': 'quiz_question is required'}), 400
-        if not ans:
-            return jsonify({
-                'error': 'Invalid input',
-                'message': 'Please enter an answer before submitting for grading.',
-            }), 400
-
-        result = grade_quiz_answer(q, key, ans)
+        fields, error = _grade_fields(request.get_json(silent=True))
+        if error is not None:
+            body, status = error
+            return jsonify(body), status
+
+        result = grade_quiz_answer(*fields)
         return jsonify(result), 200
     except ValueError as e:
         return jsonify({'error': 'Invalid input', 'message': str(e)}), 400
     except Exception as e:
         print(f"Error grading quiz: {e}")
+        return jsonify(GRADING_FAILED), 500
+
+
+@budget_bp.route('/grade-quiz/batch', methods=['POST'])
+def grade_quiz_batch_endpoint():
+    """
+    Grade many students' answers to one question (teacher dashboard re-grade).
+
+    JSON body:
+    {
+        "quiz_question": "...",
+        "quiz_answer_key": "...",
+        "answers": ["15-20%", "about 10 percent", ...]
+    }
+
+    Response, one entry per answer in input order:
+    {"results": [{"index": 0, "status": 200, "result": {...same as /api/grade-quiz...}},
+                 {"index": 1, "status": 400, "error": "Invalid input", "message": "..."}]}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid request', 'message': 'Send JSON body'}), 400
+    answers = data.get('answers')
+    if not isinstance(answers, list) or not answers:
+        return jsonify({'error': 'Invalid input', 'message': 'answers must be a non-empty list'}), 400
+    max_items = int(os.getenv('GRADE_BATCH_MAX_ITEMS', '500'))
+    if len(answers) > max_items:
         return jsonify({
-            'error': 'Grading failed',
-            'message': 'Could not grade this answer. Please try again.',
-        }), 500
+            'error': 'Invalid request',
+            'message': f'At most {max_items} answers per batch (got {len(answers)})',
+        }), 400
+
+    question = (data.get('quiz_question') or '').strip()
+    if not question:
+        return jsonify({'error': 'Invalid input', 'message': 'quiz_question is required'}), 400
+    key = (data.get('quiz_answer_key') or '').strip()
+
+    results = [None] * len(answers)
+    valid_indices = []
+    valid_answers = []
+    for index, answer in enumerate(answers):
+        fields, error = _grade_fields({
+            'quiz_question': question,
+            'quiz_answer_key': key,
+            'user_answer': answer if isinstance(answer, str) else None,
+        })
+        if error is not None:
+            body, status = error
+            results[index] = {'index': index, 'status': status, **body}
+        else:
+            valid_indices.append(index)
+            valid_answers.append(fields[2])
+
+    try:
+        if valid_answers:
+            graded = grade_quiz_answers_batch(question, key, valid_answers)
+            for index, result in zip(valid_indices, graded):
+                results[index] = {'index': index, 'status': 200, 'result': result}
+        return jsonify({'results': results}), 200
+    except Exception as e:
+        print(f"Error grading quiz batch: {e}")
+        return jsonify(GRADING_FAILED), 500
 
 
 @budget_bp.route('/analyze/demo', methods=['GET'])
@@ -125,7 +356,13 @@ def demo_analysis():
     """
     Returns a demo analysis with sample data.
     Useful for testing the frontend without AI API calls.
+    Static, so it is serialized once and served with an ETag and Cache-Control.
     """
+    return cached_json_response(_demo_body())
+
+
+@lru_cache(maxsize=1)
+def _demo_body():
     demo_result = {
         'analysis': 'Demo analysis text (see financial_advice, quiz_question, grounded_tip).',
         'financial_advice': (
@@ -149,6 +386,7 @@ def demo_analysis():
         ),
         'grounded_rule_citation': 'Emergency Fund Guideline; Savings Benchmarks; Housing 30% guideline',
         'output_source': 'demo_static',
+        'cache_hit': False,
         'saving_tips': [
             'You have $500 left after expenses—consider directing part to savings.',
         ],
@@ -186,4 +424,4 @@ def demo_analysis():
             'Awareness is the first step to better finances',
         ],
     }
-    return jsonify(demo_result), 200
+    return CachedBody(demo_result)
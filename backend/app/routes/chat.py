@@ -1,43 +1,37 @@
 """
 Chat API routes - simple budgeting chatbot powered by Gemini.
+
+POST /api/chat returns the whole reply; POST /api/chat/stream forwards tokens as Server-Sent Events.
 """
 
 from flask import Blueprint, request, jsonify
 
+from app.routes.streaming import sse_event, sse_response
+from app.services.deadlines import endpoint_deadline, iter_with_deadline, run_with_deadline
+from app.services.metrics import RequestTimer
+
 chat_bp = Blueprint('chat', __name__)
 
+CHAT_MODEL = "gemini-2.0-flash"
+CHAT_CONFIG = {
+    "max_output_tokens": 400,
+    "temperature": 0.6,
+}
 
-@chat_bp.route('/chat', methods=['POST'])
-def chat():
-  """
-  Simple budgeting chatbot endpoint.
 
-  Expected JSON body:
-  {
-      "message": "How can I cut my food spending?",
-      "context": {
-          "monthly_income": 3000,
-          "goal": "emergency_fund"
-      }
-  }
+def _chat_request(data):
+  """
+  Returns ((monthly_income, prompt), None) or (None, (error_body, status)).
+  Shared by the Flask route and the ASGI serving mode (app/asgi.py).
   """
-  from app.services.ai_service import get_gemini_client, GENAI_STUDIO_AVAILABLE
-
-  if not GENAI_STUDIO_AVAILABLE:
-      return jsonify({
-          'error': 'unavailable',
-          'message': 'Chatbot is currently unavailable.'
-      }), 503
-
-  data = request.get_json() or {}
   message = (data.get('message') or '').strip()
   context = data.get('context') or {}
 
   if not message:
-      return jsonify({
+      return None, ({
           'error': 'invalid_request',
           'message': 'message is required'
-      }), 400
+      }, 400)
 
   monthly_income = context.get('monthly_income')
   goal = context.get('goal')
@@ -50,10 +44,7 @@ def chat():
 
   context_text = "\n".join(context_lines) if context_lines else "No additional context."
 
-  try:
-      client = get_gemini_client()
-
-      prompt = f"""User question:
+  prompt = f"""User question:
 {message}
 
 User context:
@@ -61,39 +52,136 @@ User context:
 
 Answer in 3-6 short sentences. Use simple language. Focus on practical budgeting and saving steps."""
 
-      response = client.models.generate_content(
-          model="gemini-2.0-flash",
-          contents=prompt,
-          config={
-              "max_output_tokens": 400,
-              "temperature": 0.6,
-          },
+  return (monthly_income, prompt), None
+
+
+def _fallback_reply(monthly_income) -> str:
+  """Rule-based reply used when Gemini quota is exhausted or any other error occurs."""
+  fallback = [
+      "I’m having trouble reaching the AI service right now, ",
+      "so here’s a general budgeting suggestion instead.\n\n",
+  ]
+  if monthly_income:
+      fallback.append(
+          f"Based on a monthly income of ${monthly_income}, start by aiming to save 10–20% each month if you can. "
       )
-      text = response.text or ''
+  fallback.append(
+      "Pick one or two categories to focus on (like food or entertainment), track what you actually spend for a month, "
+      "and then set a small, realistic reduction goal for next month (for example, $25–$50 less). "
+      "Automating a transfer to savings on payday is one of the easiest ways to make progress without having to think about it every time."
+  )
+  return "".join(fallback)
+
+
+@chat_bp.route('/chat', methods=['POST'])
+def chat():
+  """
+  Simple budgeting chatbot endpoint.
 
+  Expected JSON body:
+  {
+      "message": "How can I cut my food spending?",
+      "context": {
+          "monthly_income": 3000,
+          "goal": "emergency_fund"
+      }
+  }
+  """
+  from app.services.ai_service import get_gemini_client, GENAI_STUDIO_AVAILABLE
+
+  if not GENAI_STUDIO_AVAILABLE:
       return jsonify({
-          'reply': text.strip(),
-      }), 200
-
-  except Exception as e:
-      # When Gemini quota is exhausted or any other error occurs, fall back to a simple rule-based reply
-      print(f"Chatbot error (falling back to rule-based reply): {e}")
-
-      fallback = [
-          "I’m having trouble reaching the AI service right now, ",
-          "so here’s a general budgeting suggestion instead.\n\n",
-      ]
-      if monthly_income:
-          fallback.append(
-              f"Based on a monthly income of ${monthly_income}, start by aiming to save 10–20% each month if you can. "
+          'error': 'unavailable',
+          'message': 'Chatbot is currently unavailable.'
+      }), 503
+
+  fields, error = _chat_request(request.get_json() or {})
+  if error is not None:
+      body, status = error
+      return jsonify(body), status
+  monthly_income, prompt = fields
+
+  with RequestTimer('chat') as req:
+      try:
+          client = get_gemini_client('chat')
+          deadline = endpoint_deadline('chat')
+
+          # Past CHAT_DEADLINE_SECONDS this raises and the rule-based reply is served
+          response = run_with_deadline(
+              lambda: client.models.generate_content(
+                  model=CHAT_MODEL,
+                  contents=prompt,
+                  config=CHAT_CONFIG,
+                  timeout=deadline,
+              ),
+              deadline,
+              'Chatbot',
           )
-      fallback.append(
-          "Pick one or two categories to focus on (like food or entertainment), track what you actually spend for a month, "
-          "and then set a small, realistic reduction goal for next month (for example, $25–$50 less). "
-          "Automating a transfer to savings on payday is one of the easiest ways to make progress without having to think about it every time."
-      )
+          text = response.text or ''
+          req.source = 'google_ai_studio'
+
+          return jsonify({
+              'reply': text.strip(),
+          }), 200
+
+      except Exception as e:
+          # When Gemini quota is exhausted or any other error occurs, fall back to a simple rule-based reply
+          print(f"Chatbot error (falling back to rule-based reply): {e}")
+          req.source = 'fallback_deterministic'
+
+          return jsonify({
+              'reply': _fallback_reply(monthly_income),
+          }), 200
+
+
+@chat_bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+  """
+  Streaming chatbot endpoint (same JSON body as POST /api/chat), answered as Server-Sent Events:
+
+  event: token     -> {"text": "..."}     one per chunk, as the model produces them
+  event: fallback  -> {"reply": "..."}    rule-based reply if the AI call fails (even mid-stream)
+                                          or runs past CHAT_STREAM_DEADLINE_SECONDS
+  event: done      -> {"reply": "..."}    the full reply the user ended up with
 
+  Errors that happen before streaming starts (bad body, SDK missing) are normal JSON responses.
+  """
+  from app.services.ai_service import get_gemini_client, GENAI_STUDIO_AVAILABLE
+
+  if not GENAI_STUDIO_AVAILABLE:
       return jsonify({
-          'reply': "".join(fallback),
-      }), 200
+          'error': 'unavailable',
+          'message': 'Chatbot is currently unavailable.'
+      }), 503
 
+  fields, error = _chat_request(request.get_json() or {})
+  if error is not None:
+      body, status = error
+      return jsonify(body), status
+  monthly_income, prompt = fields
+
+  def events():
+      parts = []
+      deadline = endpoint_deadline('chat_stream')
+      try:
+          chunks = iter_with_deadline(
+              lambda: get_gemini_client('chat_stream').models.generate_content_stream(
+                  model=CHAT_MODEL,
+                  contents=prompt,
+                  config=CHAT_CONFIG,
+                  timeout=deadline,
+              ),
+              deadline,
+              'Chatbot stream',
+          )
+          for text in chunks:
+              parts.append(text)
+              yield sse_event('token', {'text': text})
+          reply = "".join(parts).strip()
+      except Exception as e:
+          print(f"Chatbot stream error (falling back to rule-based reply): {e}")
+          reply = _fallback_reply(monthly_income)
+          yield sse_event('fallback', {'reply': reply})
+      yield sse_event('done', {'reply': reply})
+
+  return sse_response(events())
@@ -5,8 +5,8 @@ ASSIGNED TO: Member 2 (Backend Lead) & Member 3 (AI/ML Lead)
 Glossary API routes - serves financial terms and definitions.
 
 TODO (Member 2):
-1. Add search functionality
-2. Add pagination for large glossary
+1. Add search functionality (done: GLOSSARY_INDEX, ranked prefix search)
+2. Add pagination for large glossary (done: limit / offset)
 
 TODO (Member 3):
 1. Add AI-powered term explanation endpoint
@@ -14,8 +14,18 @@ TODO (Member 3):
 ============================================
 """
 
+import os
+from functools import lru_cache
+from pathlib import Path
+
 from flask import Blueprint, request, jsonify
 
+from app.routes.http_cache import CachedBody, cached_json_response
+from app.services.deadlines import endpoint_deadline, run_with_deadline
+from app.services.explanation_store import ExplanationStore
+from app.services.glossary_index import GlossaryIndex
+from app.services.metrics import RequestTimer
+
 glossary_bp = Blueprint('glossary', __name__)
 
 # Financial glossary data
@@ -83,97 +93,138 @@ GLOSSARY_TERMS = [
     },
 ]
 
+# Built once at import; rebuild it if GLOSSARY_TERMS changes
+GLOSSARY_INDEX = GlossaryIndex(GLOSSARY_TERMS)
+
+
+def _page_arg(name, default):
+    """Non-negative int query param. Returns (value, None) or (None, error message)."""
+    raw = request.args.get(name)
+    if raw is None or raw == '':
+        return default, None
+    try:
+        value = int(raw)
+    except ValueError:
+        return None, f'{name} must be an integer'
+    if value < 0:
+        return None, f'{name} must be 0 or more'
+    return value, None
+
+
 @glossary_bp.route('/glossary', methods=['GET'])
 def get_glossary():
     """
-    Get all glossary terms.
+    Get glossary terms.
     Optional query params:
     - category: Filter by category (basics, investing, economics)
-    - search: Search term in name or definition
+    - search: Words to find in the name or definition (prefixes match; best matches first)
+    - limit, offset: Page through the results (default: all terms from offset 0)
+
+    When a search finds nothing, `did_you_mean` lists term names close to it.
+    Responses carry an ETag and Cache-Control (see app/routes/http_cache.py).
     """
     category = request.args.get('category')
-    search = request.args.get('search', '').lower()
-    
-    terms = GLOSSARY_TERMS
-    
-    # Filter by category
-    if category:
-        terms = [t for t in terms if t['category'] == category]
-    
-    # Filter by search term
-    if search:
-        terms = [t for t in terms if 
-                 search in t['term'].lower() or 
-                 search in t['definition'].lower()]
-    
-    return jsonify({
+    search = request.args.get('search', '')
+    limit, error = _page_arg('limit', None)
+    if error is None:
+        offset, error = _page_arg('offset', 0)
+    if error is not None:
+        return jsonify({'error': 'Invalid request', 'message': error}), 400
+
+    return cached_json_response(_glossary_body(category or None, search, limit, offset))
+
+
+@lru_cache(maxsize=1024)
+def _glossary_body(category, search, limit, offset):
+    """Serialized GET /api/glossary response per query (the glossary only changes on deploy)."""
+    terms, total = GLOSSARY_INDEX.search(search, category=category, limit=limit, offset=offset)
+
+    body = {
         'terms': terms,
-        'count': len(terms)
-    }), 200
+        'count': len(terms),
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+    }
+    if search.strip() and total == 0:
+        # Probably a typo ("diversificaton"): suggest the closest term names
+        body['did_you_mean'] = GLOSSARY_INDEX.did_you_mean(search)
+    return CachedBody(body)
+
+
+# Serialized once at import for conditional GETs
+_TERM_BODIES = {t['id']: CachedBody(t) for t in GLOSSARY_TERMS}
 
 
 @glossary_bp.route('/glossary/<int:term_id>', methods=['GET'])
 def get_term(term_id):
     """Get a specific glossary term by ID."""
-    term = next((t for t in GLOSSARY_TERMS if t['id'] == term_id), None)
+    body = _TERM_BODIES.get(term_id)
     
-    if not term:
+    if not body:
         return jsonify({
             'error': 'Not found',
             'message': f'Term with ID {term_id} not found'
         }), 404
     
-    return jsonify(term), 200
+    return cached_json_response(body)
 
 
-@glossary_bp.route('/glossary/explain', methods=['POST'])
-def explain_term():
-    """
-    Get an AI-powered explanation of a financial term using Gemini.
+EXPLAIN_MODEL = "gemini-2.0-flash"
+EXPLAIN_CONFIG = {
+    "max_output_tokens": 400,
+    "temperature": 0.5,
+}
 
-    Expected JSON body:
-    {
-        "term": "ETF",
-        "complexity": "beginner"  // beginner, intermediate, advanced
-    }
-    """
-    # Import here to avoid circular imports at module load time
-    from app.services.ai_service import get_gemini_client, GENAI_STUDIO_AVAILABLE
+# Bump whenever the standard prompt in _explain_request changes, so stored explanations are rewritten.
+EXPLAIN_PROMPT_VERSION = "explain-2-paragraphs-v1"
 
-    if not GENAI_STUDIO_AVAILABLE:
-        return jsonify({
-            'error': 'unavailable',
-            'message': 'AI explanations are currently unavailable.'
-        }), 503
 
-    data = request.get_json() or {}
+def _default_store_path() -> str:
+    """Per-user app data dir (XDG_DATA_HOME / LOCALAPPDATA), never the source tree or a shared temp dir."""
+    base = os.getenv("XDG_DATA_HOME") or os.getenv("LOCALAPPDATA") or str(Path.home() / ".local" / "share")
+    return str(Path(base) / "my-dolla-sign" / "explanations.sqlite3")
+
+
+# Standard (non-custom) explanations of glossary terms, shared by every learner.
+# EXPLAIN_STORE_DB= keeps them in memory only.
+EXPLANATION_STORE = ExplanationStore(
+    db_path=os.getenv("EXPLAIN_STORE_DB", _default_store_path()).strip() or None,
+    prompt_version=f"{EXPLAIN_PROMPT_VERSION}:{EXPLAIN_MODEL}",
+    ttl_seconds=float(os.getenv("EXPLAIN_STORE_TTL_SECONDS", str(7 * 86400))),
+    max_entries=int(os.getenv("EXPLAIN_STORE_MAX_ENTRIES", "512")),
+)
+
+
+def _explain_request(data):
+    """
+    Returns ((term, complexity, custom_prompt, entry, prompt), None) or (None, (error_body, status)).
+    `term` is the name as the user sent it; `entry` is the glossary term it names (an exact match
+    or a clear typo, see GlossaryIndex.fuzzy_find), or None.
+    Shared by the Flask route and the ASGI serving mode (app/asgi.py).
+    """
     term = (data.get('term') or '').strip()
     complexity = (data.get('complexity') or 'beginner').lower()
     custom_prompt = (data.get('custom_prompt') or '').strip()
 
     if not term:
-        return jsonify({
+        return None, ({
             'error': 'invalid_request',
             'message': 'term is required'
-        }), 400
+        }, 400)
 
     if complexity not in ['beginner', 'intermediate', 'advanced']:
         complexity = 'beginner'
 
-    # Try to find a base glossary definition
-    base_def = next(
-        (t for t in GLOSSARY_TERMS if t['term'].lower() == term.lower()),
-        None,
-    )
-    base_text = base_def['definition'] if base_def else ''
+    # Try to find a base glossary definition; only a clear typo ("compund interest") resolves to
+    # a glossary term, anything else is explained as typed without a borrowed definition
+    entry = GLOSSARY_INDEX.fuzzy_find(term)
+    name = entry['term'] if entry else term
+    base_text = entry['definition'] if entry else ''
 
-    try:
-        # Try AI first; if it fails, we'll fall back to rule-based explanation below
-        client = get_gemini_client()
-
-        if custom_prompt:
-            # User provided a custom prompt/question
-            prompt = f"""The user is asking about the financial term "{term}".
+    if custom_prompt:
+        # User provided a custom prompt/question
+        prompt = f"""The user is asking about the financial term "{name}".
 
 Existing definition (if helpful): {base_text}
 
@@ -181,9 +232,9 @@ User's specific question/request: {custom_prompt}
 
 Answer their question clearly and simply. Use 2-4 short paragraphs. Include examples if helpful. Do NOT recommend specific investments or products.
 """
-        else:
-            # Standard explanation
-            prompt = f"""Explain the financial term "{term}" for a {complexity} learner.
+    else:
+        # Standard explanation
+        prompt = f"""Explain the financial term "{name}" for a {complexity} learner.
 
 Existing definition (if helpful): {base_text}
 
@@ -197,37 +248,124 @@ Format:
 - First paragraph: simple explanation.
 - Second paragraph: example.
 """
+    return (term, complexity, custom_prompt, entry, prompt), None
+
+
+def generate_explanation(prompt, timeout=None):
+    """One Gemini call for an explanation prompt; returns the stripped text (may be empty)."""
+    from app.services.ai_service import get_gemini_client
+
+    response = get_gemini_client('explain').models.generate_content(
+        model=EXPLAIN_MODEL,
+        contents=prompt,
+        config=EXPLAIN_CONFIG,
+        timeout=timeout,
+    )
+    return (response.text or "").strip()
+
 
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-            config={
-                "max_output_tokens": 400,
-                "temperature": 0.5,
-            },
+def _explain_body(term, complexity, entry, explanation, cache_hit):
+    """Response body; `did_you_mean` lists glossary names when `term` is not one of them."""
+    body = {'term': term, 'complexity': complexity, 'explanation': explanation, 'cache_hit': cache_hit}
+    if entry is None:
+        suggestions = GLOSSARY_INDEX.did_you_mean(term)
+        if suggestions:
+            body['did_you_mean'] = suggestions
+    elif entry['term'] != term:
+        body['glossary_term'] = entry['term']
+    return body
+
+
+def _stored_explanation(term, complexity, custom_prompt, entry, prompt):
+    """
+    Response body for a standard request already in EXPLANATION_STORE, else None.
+    A stale entry is still served; a background refresh replaces it for the next learner.
+    """
+    from app.services.ai_service import GENAI_STUDIO_AVAILABLE
+
+    if custom_prompt or entry is None:
+        return None
+    name = entry['term']
+    stored = EXPLANATION_STORE.get(name, complexity)
+    if stored is None:
+        return None
+    text, stale = stored
+    if stale and GENAI_STUDIO_AVAILABLE:
+        EXPLANATION_STORE.refresh_in_background(
+            name, complexity, lambda: generate_explanation(prompt, endpoint_deadline('explain'))
         )
-        text = response.text or ""
+    return _explain_body(term, complexity, entry, text, True)
 
-        return jsonify({
-            'term': term,
-            'complexity': complexity,
-            'explanation': text.strip(),
-        }), 200
-
-    except Exception as e:
-        # Log for debugging, but don't break the UI
-        print(f"Glossary AI explanation error (fallback to rule-based): {type(e).__name__}: {e}")
-
-    # Rule-based fallback explanation when AI fails
-    if base_text:
-        explanation = f"Here is a simple explanation of {term}:\n\n{base_text}\n\n"
+
+def _remember_explanation(complexity, custom_prompt, entry, text):
+    """Store a standard explanation of a glossary term (free-text terms are never persisted)."""
+    if text and not custom_prompt and entry is not None:
+        EXPLANATION_STORE.put(entry['term'], complexity, text)
+
+
+def _fallback_explanation(term, entry, custom_prompt):
+    """Rule-based fallback explanation when AI fails."""
+    if entry:
+        name, base_text = entry['term'], entry['definition']
+        explanation = f"Here is a simple explanation of {name}:\n\n{base_text}\n\n"
         if custom_prompt:
-            explanation += f"In the context of your question (“{custom_prompt}”), think of {term} this way: {base_text}"
+            explanation += f"In the context of your question (“{custom_prompt}”), think of {name} this way: {base_text}"
     else:
         explanation = f"{term} is a financial term. At the moment we don't have a detailed definition stored, but it usually refers to a concept used in investing or budgeting."
+    return explanation
+
+
+@glossary_bp.route('/glossary/explain', methods=['POST'])
+def explain_term():
+    """
+    Get an AI-powered explanation of a financial term using Gemini.
+    Standard explanations are served from EXPLANATION_STORE when present (`cache_hit`).
+
+    Expected JSON body:
+    {
+        "term": "ETF",
+        "complexity": "beginner"  // beginner, intermediate, advanced
+    }
+    """
+    # Import here to avoid circular imports at module load time
+    from app.services.ai_service import GENAI_STUDIO_AVAILABLE
+
+    fields, error = _explain_request(request.get_json() or {})
+    if error is not None:
+        body, status = error
+        return jsonify(body), status
+    term, complexity, custom_prompt, entry, prompt = fields
+
+    with RequestTimer('explain') as req:
+        stored = _stored_explanation(term, complexity, custom_prompt, entry, prompt)
+        if stored is not None:
+            req.source = 'store'
+            return jsonify(stored), 200
+
+        if not GENAI_STUDIO_AVAILABLE:
+            req.source = 'unavailable'
+            return jsonify({
+                'error': 'unavailable',
+                'message': 'AI explanations are currently unavailable.'
+            }), 503
+
+        try:
+            # Try AI first; if it fails, we'll fall back to rule-based explanation below
+            deadline = endpoint_deadline('explain')
+            text = run_with_deadline(
+                lambda: generate_explanation(prompt, deadline),
+                deadline,
+                'Glossary AI explanation',
+            )
+            _remember_explanation(complexity, custom_prompt, entry, text)
+            req.source = 'google_ai_studio'
+
+            return jsonify(_explain_body(term, complexity, entry, text, False)), 200
+
+        except Exception as e:
+            # Log for debugging, but don't break the UI
+            print(f"Glossary AI explanation error (fallback to rule-based): {type(e).__name__}: {e}")
 
-    return jsonify({
-        'term': term,
-        'complexity': complexity,
-        'explanation': explanation,
-    }), 200
+        req.source = 'fallback_deterministic'
+        fallback = _fallback_explanation(term, entry, custom_prompt)
+        return jsonify(_explain_body(term, complexity, entry, fallback, False)), 200
@@ -0,0 +1,66 @@
+"""
+HTTP caching for read-only JSON endpoints (glossary lookups, the demo analysis).
+
+These bodies only change on deploy, yet every request used to re-serialize them with no cache
+headers. A `CachedBody` is serialized (and, above COMPRESS_MIN_BYTES, gzip-compressed) once,
+with a strong ETag per representation. `cached_json_response` answers `If-None-Match` with a
+bodiless 304 only when the client holds the representation it would get now (an ETag from the
+gzip body is no use to a client that cannot decode it), and sends `Cache-Control: public`, so
+browsers and CDNs reuse the response.
+
+    HTTP_CACHE_MAX_AGE=3600    seconds a cache may reuse a response without revalidating
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Optional
+
+from flask import Response, request
+
+# Below this, gzip saves less than the headers and CPU cost
+COMPRESS_MIN_BYTES = 1024
+
+
+class CachedBody:
+    """A JSON payload serialized once: identity bytes, optional gzip bytes and their ETags."""
+
+    __slots__ = ("body", "etag", "gzip_body", "gzip_etag")
+
+    def __init__(self, payload: Any) -> None:
+        # Same bytes as Flask's jsonify outside debug mode (sorted keys, compact, ASCII)
+        self.body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("ascii") + b"\n"
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag: str = digest
+        self.gzip_body: Optional[bytes] = None
+        self.gzip_etag: Optional[str] = None
+        if len(self.body) >= COMPRESS_MIN_BYTES:
+            # mtime=0 keeps the compressed bytes (and so the ETag) stable across restarts
+            self.gzip_body = gzip.compress(self.body, compresslevel=6, mtime=0)
+            self.gzip_etag = f"{digest}-gzip"
+
+
+def cache_control(max_age: Optional[int] = None) -> str:
+    if max_age is None:
+        max_age = int(os.getenv("HTTP_CACHE_MAX_AGE", "3600"))
+    return f"public, max-age={max_age}"
+
+
+def cached_json_response(cached: CachedBody, max_age: Optional[int] = None) -> Response:
+    """200 with the (possibly gzip) body, or 304 when the client already holds the negotiated one."""
+    use_gzip = cached.gzip_body is not None and request.accept_encodings["gzip"] > 0
+    etag = cached.gzip_etag if use_gzip else cached.etag
+    headers = {"Cache-Control": cache_control(max_age)}
+    if cached.gzip_body is not None:
+        headers["Vary"] = "Accept-Encoding"
+
+    held = request.if_none_match
+    if held.star_tag or held.contains_weak(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        response = Response(cached.gzip_body if use_gzip else cached.body, mimetype="application/json", headers=headers)
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,30 @@
+"""
+Traced Flask routes: a trace per request (app/services/tracing.py) and its `Server-Timing` header.
+"""
+
+import functools
+
+from flask import make_response
+
+from app.services.tracing import finish_trace, server_timing_enabled, start_trace
+
+
+def traced(name):
+    """Route decorator: spans inside the view (and the services it calls) land in one trace."""
+    def wrap(view):
+        @functools.wraps(view)
+        def run(*args, **kwargs):
+            trace = start_trace(name)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                finish_trace(trace, 500)
+                raise
+            finish_trace(trace, response.status_code)
+            if server_timing_enabled():
+                response.headers['Server-Timing'] = trace.server_timing()
+            return response
+
+        return run
+
+    return wrap
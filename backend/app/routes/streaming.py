@@ -0,0 +1,33 @@
+"""
+Streaming response helpers: Server-Sent Events for /api/analyze/stream and /api/chat/stream,
+newline-delimited JSON for the batch endpoints.
+"""
+
+from flask import Response, current_app, stream_with_context
+
+
+def sse_event(event, data):
+    """One Server-Sent Events frame with a JSON payload."""
+    return f"event: {event}\ndata: {current_app.json.dumps(data)}\n\n"
+
+
+def sse_response(frames):
+    """Wrap a generator of sse_event() strings; disables proxy buffering so frames flush immediately."""
+    return Response(
+        stream_with_context(frames),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def ndjson_response(lines):
+    """Stream one JSON document per line (application/x-ndjson) from a generator of payloads."""
+    def frames():
+        for payload in lines:
+            yield f"{current_app.json.dumps(payload)}\n"
+
+    return Response(
+        stream_with_context(frames()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
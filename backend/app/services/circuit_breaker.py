@@ -0,0 +1,183 @@
+"""
+Per-backend circuit breakers for the Gemini tiers.
+
+When AI Studio is throttling, every request used to wait for the Studio call to fail before
+trying Vertex and then the deterministic fallback. A breaker watches the last N calls to a
+backend; once too many of them fail (or are too slow) it opens and callers skip that backend
+immediately. After a cool-down it lets a single probe through (half-open): success closes it,
+failure opens it again.
+
+Every state change (and every new probe) starts a new generation. `allow()` hands the caller the
+generation its call belongs to, and outcomes reported with an older generation are dropped: a slow
+call that started while the breaker was closed cannot close (or re-open) it after it has tripped.
+
+Tuning (env, shared by all backends):
+    AI_BREAKER_WINDOW=20           calls remembered per backend
+    AI_BREAKER_MIN_CALLS=5         calls needed before the breaker can trip
+    AI_BREAKER_FAILURE_RATE=0.5    trip when this share of the window failed
+    AI_BREAKER_SLOW_SECONDS=8      a successful call slower than this counts as slow...
+    AI_BREAKER_SLOW_RATE=0.8       ...and the breaker trips when this share was slow
+    AI_BREAKER_OPEN_SECONDS=30     cool-down before a half-open probe
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Thread-safe breaker with a sliding window of call outcomes."""
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_seconds: float = 8.0,
+        slow_rate: float = 0.8,
+        open_seconds: float = 30.0,
+    ) -> None:
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        # (failed, slow) per call, newest last
+        self._outcomes: deque = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_started_at = 0.0
+        # Starts at 1 so a ticket from allow() is always truthy
+        self._generation = 1
+        self._trips = 0
+        self._short_circuited = 0
+        self._stale_results = 0
+
+    def allow(self) -> Optional[int]:
+        """
+        The generation ticket for a call that may go to this backend now, or None (counted as
+        skipped). Pass the ticket back to record_success / record_failure / release.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+                self._state = HALF_OPEN
+                self._probe_started_at = 0.0
+            if self._state == CLOSED:
+                return self._generation
+            if self._state == HALF_OPEN:
+                # One probe at a time; a probe that never reported back is replaced after the cool-down
+                if not self._probe_started_at or now - self._probe_started_at >= self.open_seconds:
+                    self._probe_started_at = now
+                    # Each probe gets its own generation, so a replaced probe's late answer is dropped
+                    self._generation += 1
+                    return self._generation
+            self._short_circuited += 1
+            return None
+
+    def record_success(self, latency_seconds: float, generation: Optional[int] = None) -> None:
+        self._record(failed=False, slow=latency_seconds >= self.slow_seconds, generation=generation)
+
+    def record_failure(self, generation: Optional[int] = None) -> None:
+        self._record(failed=True, slow=False, generation=generation)
+
+    def release(self, generation: Optional[int] = None) -> None:
+        """
+        The allowed call ended without telling us anything about the backend (the caller's own
+        budget ran out): record no outcome, but free the half-open probe slot for the next caller.
+        """
+        with self._lock:
+            if self._state == HALF_OPEN and not self._is_stale(generation):
+                self._probe_started_at = 0.0
+
+    def _is_stale(self, generation: Optional[int]) -> bool:
+        """Caller holds the lock. None (no ticket) is treated as current."""
+        return generation is not None and generation != self._generation
+
+    def _record(self, failed: bool, slow: bool, generation: Optional[int] = None) -> None:
+        with self._lock:
+            if self._is_stale(generation):
+                self._stale_results += 1
+                return
+            if self._state == HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                else:
+                    self._state = CLOSED
+                    self._generation += 1
+                    self._outcomes.clear()
+                return
+            self._outcomes.append((failed, slow))
+            if self._state == CLOSED and len(self._outcomes) >= self.min_calls:
+                n = len(self._outcomes)
+                failures = sum(1 for f, _ in self._outcomes if f)
+                slow_calls = sum(1 for _, s in self._outcomes if s)
+                if failures / n >= self.failure_rate or slow_calls / n >= self.slow_rate:
+                    self._open()
+
+    def _open(self) -> None:
+        """Caller holds the lock."""
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._generation += 1
+        self._outcomes.clear()
+        self._trips += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            n = len(self._outcomes)
+            failures = sum(1 for f, _ in self._outcomes if f)
+            state = self._state
+            retry_in = 0.0
+            if state == OPEN:
+                retry_in = max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+            return {
+                "state": state,
+                "window_calls": n,
+                "window_failure_rate": round(failures / n, 3) if n else 0.0,
+                "trips": self._trips,
+                "short_circuited": self._short_circuited,
+                "stale_results": self._stale_results,
+                "retry_in_seconds": round(retry_in, 1),
+            }
+
+
+def _from_env() -> Dict[str, Any]:
+    return {
+        "window": int(os.getenv("AI_BREAKER_WINDOW", "20")),
+        "min_calls": int(os.getenv("AI_BREAKER_MIN_CALLS", "5")),
+        "failure_rate": float(os.getenv("AI_BREAKER_FAILURE_RATE", "0.5")),
+        "slow_seconds": float(os.getenv("AI_BREAKER_SLOW_SECONDS", "8")),
+        "slow_rate": float(os.getenv("AI_BREAKER_SLOW_RATE", "0.8")),
+        "open_seconds": float(os.getenv("AI_BREAKER_OPEN_SECONDS", "30")),
+    }
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(backend: str) -> CircuitBreaker:
+    """Process-wide breaker for a backend (output_source name, e.g. "google_ai_studio")."""
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(backend)
+        if breaker is None:
+            breaker = CircuitBreaker(backend, **_from_env())
+            _BREAKERS[backend] = breaker
+        return breaker
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """Snapshot of every breaker that has seen traffic (for /api/health)."""
+    with _BREAKERS_LOCK:
+        breakers = list(_BREAKERS.values())
+    return {b.name: b.snapshot() for b in breakers}
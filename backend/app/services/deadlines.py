@@ -0,0 +1,212 @@
+"""
+Per-endpoint latency budgets and hedging for Gemini calls.
+
+The SDK calls have no timeout of their own, so one slow upstream answer used to hold a worker for
+as long as Google took. Each AI endpoint now has a budget; when it runs out the caller serves its
+deterministic fallback instead:
+
+    ANALYZE_DEADLINE_SECONDS=30        POST /api/analyze (and each item of /api/analyze/batch)
+    GRADE_DEADLINE_SECONDS=20          POST /api/grade-quiz
+    GRADE_BATCH_DEADLINE_SECONDS=45    each packed prompt of POST /api/grade-quiz/batch
+    CHAT_DEADLINE_SECONDS=20           POST /api/chat
+    EXPLAIN_DEADLINE_SECONDS=20        POST /api/glossary/explain
+
+    ANALYZE_STREAM_DEADLINE_SECONDS=60  the whole of POST /api/analyze/stream
+    CHAT_STREAM_DEADLINE_SECONDS=60     the whole of POST /api/chat/stream
+
+The defaults are backstops well above a healthy Gemini p99 for each call's output size (analyze
+asks for up to 2500 tokens), so only a stuck call hits them; tighten them from measured latencies
+(GET /metrics). 0 disables the budget for that endpoint. In the sync (Flask) mode the call runs on
+a small shared pool and the request thread stops waiting at the deadline. The same budget is
+passed to the SDK call itself, so an abandoned call ends soon after and frees its pool thread. A
+call cut off by the caller's budget says nothing about the backend, so it is not counted as a
+circuit breaker failure. Calls the SDK cannot time out (Vertex) are bounded by shedding instead:
+while calls past their deadline hold most of the pool, new calls fail fast to the fallback rather
+than queueing behind them. In the ASGI mode the call is simply cancelled.
+
+Hedging (AI_HEDGE=1, off by default): when the primary backend has not answered by its own p95
+latency, the alternate backend is asked as well and the first good answer wins. It costs extra
+quota on slow calls only (about 5% of them by construction), in exchange for a shorter tail.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, Optional
+
+DEADLINE_ENV = {
+    "analyze": ("ANALYZE_DEADLINE_SECONDS", 30.0),
+    "grade": ("GRADE_DEADLINE_SECONDS", 20.0),
+    "grade_batch": ("GRADE_BATCH_DEADLINE_SECONDS", 45.0),
+    "chat": ("CHAT_DEADLINE_SECONDS", 20.0),
+    "explain": ("EXPLAIN_DEADLINE_SECONDS", 20.0),
+    "analyze_stream": ("ANALYZE_STREAM_DEADLINE_SECONDS", 60.0),
+    "chat_stream": ("CHAT_STREAM_DEADLINE_SECONDS", 60.0),
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """The endpoint's latency budget ran out before any backend answered."""
+
+
+def endpoint_deadline(endpoint: str) -> Optional[float]:
+    """Seconds allowed for this endpoint's model call, or None when disabled."""
+    env_var, default = DEADLINE_ENV[endpoint]
+    seconds = float(os.getenv(env_var, str(default)))
+    return seconds if seconds > 0 else None
+
+
+def hedging_enabled() -> bool:
+    return os.getenv("AI_HEDGE", "").strip().lower() in ("1", "true", "yes")
+
+
+class LatencyTracker:
+    """Recent successful call latencies per backend, for the hedging trigger."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, backend: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(backend)
+            if samples is None:
+                samples = self._samples[backend] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, backend: str, pct: float) -> Optional[float]:
+        """None until min_samples calls have been seen (too little data to hedge on)."""
+        with self._lock:
+            samples = sorted(self._samples.get(backend, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def p95(self, backend: str) -> Optional[float]:
+        return self.percentile(backend, 95)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            backends = list(self._samples)
+        return {
+            b: {"p50": self.percentile(b, 50), "p95": self.p95(b), "samples": len(self._samples[b])}
+            for b in backends
+        }
+
+
+LATENCY = LatencyTracker()
+
+# Threads that actually wait on the SDK while request threads wait on the deadline
+_CALL_POOL: Optional[ThreadPoolExecutor] = None
+_CALL_POOL_LOCK = threading.Lock()
+_CALL_WORKERS = 0
+# Calls still running after their caller gave up on them
+_ABANDONED = 0
+
+
+def call_pool() -> ThreadPoolExecutor:
+    global _CALL_POOL, _CALL_WORKERS
+    with _CALL_POOL_LOCK:
+        if _CALL_POOL is None:
+            _CALL_WORKERS = max(1, int(os.getenv("AI_CALL_WORKERS", "32")))
+            _CALL_POOL = ThreadPoolExecutor(max_workers=_CALL_WORKERS, thread_name_prefix="ai-call")
+        return _CALL_POOL
+
+
+def submit_call(fn: Callable[..., Any], label: str, *args: Any) -> Future:
+    """Submit to call_pool, or fail fast while abandoned calls hold all but a quarter of it."""
+    pool = call_pool()
+    with _CALL_POOL_LOCK:
+        if _ABANDONED >= _CALL_WORKERS - _CALL_WORKERS // 4:
+            raise DeadlineExceeded(f"{label}: {_ABANDONED} earlier calls are still running past their deadline")
+    return pool.submit(fn, *args)
+
+
+def abandon_call(future: Future) -> None:
+    """Count a still-running call we stopped waiting for until it finishes."""
+    global _ABANDONED
+    if future.cancel():
+        return
+    with _CALL_POOL_LOCK:
+        _ABANDONED += 1
+
+    def finished(_future: Future) -> None:
+        global _ABANDONED
+        with _CALL_POOL_LOCK:
+            _ABANDONED -= 1
+
+    future.add_done_callback(finished)
+
+
+def abandoned_calls() -> int:
+    with _CALL_POOL_LOCK:
+        return _ABANDONED
+
+
+def run_with_deadline(fn: Callable[[], Any], seconds: Optional[float], label: str) -> Any:
+    """Run fn() and return its result, or raise DeadlineExceeded after `seconds` (None = no limit)."""
+    if seconds is None:
+        return fn()
+    future = submit_call(fn, label)
+    try:
+        return future.result(timeout=seconds)
+    except FutureTimeout:
+        abandon_call(future)
+        raise DeadlineExceeded(f"{label}: no answer within {seconds:g}s") from None
+
+
+def iter_with_deadline(make_iter: Callable[[], Iterable[Any]], seconds: Optional[float], label: str) -> Iterator[Any]:
+    """
+    Yield the items of make_iter(), raising DeadlineExceeded once `seconds` (None = no limit) have
+    passed since the start. The iterator runs on the call pool, so a stream that stops sending
+    cannot hold the request thread past the deadline. When this generator is closed or times out,
+    the underlying iterator is closed after the item it is waiting for.
+    """
+    if seconds is None:
+        yield from make_iter()
+        return
+    items: "queue.Queue[tuple]" = queue.Queue()
+    stop = threading.Event()
+
+    def produce() -> None:
+        iterator = None
+        try:
+            iterator = iter(make_iter())
+            for item in iterator:
+                items.put((True, item))
+                if stop.is_set():
+                    break
+            items.put((False, None))
+        except Exception as e:
+            # Includes make_iter() itself failing (no client, bad credentials): report it now
+            items.put((False, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    end = time.monotonic() + seconds
+    future = submit_call(produce, label)
+    finished = False
+    try:
+        while True:
+            try:
+                more, value = items.get(timeout=max(0.0, end - time.monotonic()))
+            except queue.Empty:
+                raise DeadlineExceeded(f"{label}: not finished within {seconds:g}s") from None
+            if not more:
+                finished = True
+                if value is not None:
+                    raise value
+                return
+            yield value
+    finally:
+        stop.set()
+        if not finished:
+            abandon_call(future)
@@ -0,0 +1,194 @@
+"""
+Persistent store of standard glossary explanations.
+
+A standard explanation depends only on (term, complexity) — and on the prompt and model that
+wrote it — so every learner clicking "Explain ETF" can share one Gemini answer. Entries live in
+a SQLite file (one row per term, complexity and prompt version) with the `max_entries` most
+recently used in memory in front. They never disappear on their own: past `ttl_seconds` an entry
+is stale, and it is still served instantly while a background thread asks the model for a fresh
+one (stale-while-revalidate). Bumping the prompt version starts a new set of keys; rows written
+for other versions are ignored, so old and new workers can share the file during a rolling
+deploy, and are pruned on open once they are older than `ttl_seconds`.
+
+The file is created with owner-only permissions (0600), and a file owned by another user is not
+opened at all: its rows would be shown to every learner.
+
+Only glossary terms are stored (the routes check); requests with a custom_prompt are per-user
+questions and never touch the store.
+scripts/prewarm_explanations.py fills it for the whole glossary offline.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+Key = Tuple[str, str, str]
+
+
+class ExplanationStore:
+    """Thread-safe; the SQLite file is opened on first use."""
+
+    def __init__(
+        self,
+        db_path: Optional[str],
+        prompt_version: str,
+        ttl_seconds: float = 7 * 86400.0,
+        refresh_workers: int = 2,
+        max_entries: int = 512,
+    ) -> None:
+        self.db_path = db_path
+        self.prompt_version = prompt_version
+        self.ttl_seconds = float(ttl_seconds)
+        self.refresh_workers = max(1, int(refresh_workers))
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._memory: "OrderedDict[Key, Tuple[float, str]]" = OrderedDict()  # key -> (created_at, text)
+        self._refreshing: Set[Key] = set()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._refreshes = 0
+        self._refresh_errors = 0
+        self._evictions = 0
+
+    def key(self, term: str, complexity: str) -> Key:
+        return (" ".join(term.casefold().split()), complexity, self.prompt_version)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Open the SQLite tier on first use. Caller holds the lock."""
+        if self._db is None and self.db_path:
+            if not _claim_file(self.db_path):
+                print(f"Explanation store: not using {self.db_path} (owned by another user); memory only")
+                self.db_path = None
+                return None
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS explanations ("
+                " term TEXT NOT NULL, complexity TEXT NOT NULL, prompt_version TEXT NOT NULL,"
+                " text TEXT NOT NULL, created_at REAL NOT NULL,"
+                " PRIMARY KEY (term, complexity, prompt_version))"
+            )
+            self._db.execute(
+                "DELETE FROM explanations WHERE prompt_version != ? AND created_at < ?",
+                (self.prompt_version, time.time() - self.ttl_seconds),
+            )
+        return self._db
+
+    def get(self, term: str, complexity: str) -> Optional[Tuple[str, bool]]:
+        """(text, stale) for a stored explanation, or None."""
+        key = self.key(term, complexity)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                db = self._connection()
+                row = None if db is None else db.execute(
+                    "SELECT created_at, text FROM explanations WHERE term = ? AND complexity = ? AND prompt_version = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+            else:
+                self._memory.move_to_end(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            stale = time.time() - entry[0] > self.ttl_seconds
+            if stale:
+                self._stale_hits += 1
+            else:
+                self._hits += 1
+            return entry[1], stale
+
+    def put(self, term: str, complexity: str, text: str) -> None:
+        key = self.key(term, complexity)
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, (created_at, text))
+            db = self._connection()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO explanations (term, complexity, prompt_version, text, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    key + (text, created_at),
+                )
+
+    def _remember(self, key: Key, entry: Tuple[float, str]) -> None:
+        """Insert into the memory tier and evict least-recently-used entries. Caller holds the lock."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._evictions += 1
+
+    def refresh_in_background(self, term: str, complexity: str, generate: Callable[[], str]) -> bool:
+        """
+        Regenerate a stale entry off the request thread; at most one refresh per key at a time.
+        Returns False if one is already running. On failure the stale text stays in place.
+        """
+        key = self.key(term, complexity)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.refresh_workers, thread_name_prefix="explain-refresh")
+            pool = self._pool
+
+        def run() -> None:
+            try:
+                text = generate()
+                if text:
+                    self.put(term, complexity, text)
+                with self._lock:
+                    self._refreshes += 1
+            except Exception as e:
+                print(f"Explanation refresh failed for {term!r} ({complexity}): {type(e).__name__}: {e}")
+                with self._lock:
+                    self._refresh_errors += 1
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        pool.submit(run)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "persistent": bool(self.db_path),
+                "prompt_version": self.prompt_version,
+                "ttl_seconds": self.ttl_seconds,
+                "entries_in_memory": len(self._memory),
+                "max_entries": self.max_entries,
+                "evictions": self._evictions,
+                "hits": self._hits,
+                "stale_hits": self._stale_hits,
+                "misses": self._misses,
+                "refreshing": len(self._refreshing),
+                "refreshes": self._refreshes,
+                "refresh_errors": self._refresh_errors,
+            }
+
+
+def _claim_file(path: str) -> bool:
+    """
+    Create the database file (and its directory) readable by this user only, or check that an
+    existing one belongs to this user. False if someone else owns it.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+        return True
+    except FileExistsError:
+        pass
+    getuid = getattr(os, "getuid", None)  # POSIX only
+    return getuid is None or os.stat(path).st_uid == getuid()
@@ -0,0 +1,240 @@
+"""
+Declarative rule table for the deterministic tier.
+
+Each `Rule` is a condition on BudgetMetrics fields (all of `when` must hold) plus the text it
+contributes to one output slot: the prompt's edge-case instructions, or a part of
+`generate_fallback_response` (advice, quiz, grounded tip, tips, insights). Thresholds come from
+docs/financial_rules.md: 50/30/20, Savings Benchmarks, Emergency Fund and the housing ~30%
+guideline.
+
+`RULE_ENGINE` compiles the table once at import. Every distinct condition (column, op, value) is
+evaluated a single time per budget into a bit mask shared by all rules that use it. The same compiled
+conditions run on one BudgetMetrics or on a BudgetMetricsBatch of column arrays.
+
+Slots are "all" (every matching rule's text, in table order), "first" (the first match, if any)
+or "one" (the first match; these slots end with an unconditional default).
+"""
+
+import operator
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models.metrics import LOW_INCOME_THRESHOLD, NUMPY_AVAILABLE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
+# (metric field, operator, value); fields exist on BudgetMetrics and BudgetMetricsBatch alike
+Condition = Tuple[str, str, float]
+
+_OPS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    id: str
+    source: str  # rule name in docs/financial_rules.md
+    when: Tuple[Condition, ...]
+    slot: Optional[str] = None  # None = scoring only, no text
+    text: str = ""  # str.format template over rule_text_context()
+    citation: str = ""
+
+
+SLOT_MODES = {
+    "prompt_edge_cases": "all",
+    "advice_alert": "first",
+    "advice_savings": "first",
+    "quiz_question": "one",
+    "quiz_answer_key": "one",
+    "grounded_tip": "one",
+    "saving_tips": "all",
+    "insights": "all",
+    "savings_rate_insight": "one",
+}
+
+OVERSPENDING = (("remaining", "<", 0),)
+HAS_INCOME = (("monthly_income", ">", 0),)
+NO_INCOME = (("monthly_income", "<=", 0),)
+HOUSING_OVER_30 = (("housing_pct", ">", 30),)
+STRONG_SAVER = (("savings_pct", ">=", 20),)
+ALWAYS: Tuple[Condition, ...] = ()
+
+RULES: Tuple[Rule, ...] = (
+    # --- Edge-case instructions appended to the Gemini prompt ---
+    Rule("overspending", "Overspending", OVERSPENDING, "prompt_edge_cases",
+         "\n⚠️ IMPORTANT: Expenses exceed income. Focus advice on reducing spending or increasing income. Do NOT suggest investing until budget is balanced."),
+    Rule("zero_income", "Budget basics", (("monthly_income", "==", 0),), "prompt_edge_cases",
+         "\n⚠️ IMPORTANT: Income is zero. Explain that a budget plan requires income data."),
+    Rule("low_income", "Budget basics", (("monthly_income", "<", LOW_INCOME_THRESHOLD),), "prompt_edge_cases",
+         "\n⚠️ IMPORTANT: Income is relatively low. Be realistic and encouraging; acknowledge some recommendations may be challenging."),
+    Rule("strong_saver", "Savings Benchmarks", STRONG_SAVER, "prompt_edge_cases",
+         "\n✅ IMPORTANT: User is already saving 20%+. Praise this and focus on fine-tuning or next steps."),
+
+    # --- Fallback financial advice ---
+    Rule("overspending", "Overspending", OVERSPENDING, "advice_alert",
+         "⚠️ Your expenses exceed income by ${deficit:.2f}. Focus on reducing spending or increasing income before saving. "),
+    Rule("housing_over_30", "Housing 30%", HOUSING_OVER_30, "advice_alert",
+         "Housing is {housing_pct:.1f}% of your income (often recommended under 30%). "),
+    Rule("savings_below_20", "50/30/20", (("savings_pct", ">=", 0), ("savings_pct", "<", 20), ("remaining", ">=", 0)),
+         "advice_savings", "You're saving {savings_pct:.1f}%; building toward 20% can help long-term. "),
+
+    # --- Fallback quiz ---
+    Rule("no_income", "Budget basics", NO_INCOME, "quiz_question",
+         "Why is entering a positive monthly income required before the tool can compute "
+         "percentages like savings rate or housing share of income?"),
+    Rule("savings_rate", "Savings Benchmarks", ALWAYS, "quiz_question",
+         "Your documented savings line is ${savings:.2f} per month, which is {savings_pct:.1f}% of "
+         "your ${monthly_income:.2f} income. Per Savings Benchmarks in financial_rules.md, "
+         "what is the recommended range for savings as a percentage of income?"),
+    Rule("no_income", "Budget basics", NO_INCOME, "quiz_answer_key",
+         "Income is needed so the tool can divide savings (and other categories) by income to get "
+         "percentages. Add your monthly take-home pay, then re-run Analyze."),
+    Rule("savings_rate", "Savings Benchmarks", ALWAYS, "quiz_answer_key",
+         "Strong answers note that you save {savings_pct:.1f}% (${savings:.2f} of "
+         "${monthly_income:.2f}). Savings Benchmarks in financial_rules.md describe about "
+         "10% as a common minimum floor, roughly 15–20% as a healthy target, and 20%+ as strong."),
+
+    # --- Fallback grounded tip (housing_pct is 0 without income, so no income check is needed there) ---
+    Rule("housing_over_30", "Housing 30%", HOUSING_OVER_30, "grounded_tip",
+         "Housing is {housing_pct:.1f}% of income; our financial_rules.md housing guideline suggests "
+         "keeping housing near or below ~30% when possible—so this is a key area to revisit.",
+         citation="Housing ~30% guideline"),
+    Rule("savings_below_15", "Savings Benchmarks", (("savings_pct", "<", 15), ("monthly_income", ">", 0)), "grounded_tip",
+         "Per Savings Benchmarks (financial_rules.md), recommended savings are about 15–20% of income; "
+         "at {savings_pct:.1f}% (${savings:.2f}/month on ${monthly_income:.2f}), gradual increases help.",
+         citation="Savings Benchmarks"),
+    Rule("emergency_fund", "Emergency Fund", ALWAYS, "grounded_tip",
+         "Per the Emergency Fund Guideline (financial_rules.md), aim for 3–6 months of essential expenses "
+         "in accessible savings; your total expenses are ${total_expenses:.2f}/month in this budget.",
+         citation="Emergency Fund Guideline"),
+
+    # --- Fallback saving tips ---
+    Rule("overspending", "Overspending", OVERSPENDING, "saving_tips",
+         "Review your top expenses—reducing any category improves the gap."),
+    Rule("surplus", "Budget basics", (("remaining", ">", 0),), "saving_tips",
+         "Consider directing part of the ${remaining:.2f} remaining toward savings."),
+    Rule("automate", "Savings Benchmarks", ALWAYS, "saving_tips",
+         "Set up automatic transfers to savings on payday."),
+
+    # --- Fallback insights ---
+    Rule("has_income", "Budget basics", HAS_INCOME, "insights",
+         "Total expenses: {expense_pct:.1f}% of income"),
+    Rule("unbalanced", "Budget basics", (("remaining", "!=", 0),), "insights",
+         "Remaining: ${remaining:.2f}"),
+    Rule("strong_saver", "Savings Benchmarks", STRONG_SAVER, "savings_rate_insight",
+         "✅ Excellent savings rate"),
+    Rule("rule_50_30_20", "50/30/20", ALWAYS, "savings_rate_insight",
+         "50/30/20: 50% needs, 30% wants, 20% savings"),
+
+    # --- Scoring only (batch analytics; no text yet) ---
+    Rule("needs_over_50", "50/30/20", (("needs_pct", ">", 50),)),
+    Rule("wants_over_30", "50/30/20", (("wants_pct", ">", 30),)),
+    Rule("savings_below_10", "Savings Benchmarks", (("savings_pct", "<", 10), ("monthly_income", ">", 0))),
+)
+
+
+def rule_text_context(m: Any) -> Dict[str, Any]:
+    """Values the rule templates may reference, from a BudgetMetrics."""
+    income = m.monthly_income
+    return {
+        "monthly_income": income,
+        "total_expenses": m.total_expenses,
+        "remaining": m.remaining,
+        "deficit": abs(m.remaining),
+        "savings": m.savings,
+        "savings_pct": m.savings_pct,
+        "housing_pct": m.housing_pct,
+        "expense_pct": (m.total_expenses / income * 100) if income > 0 else 0,
+    }
+
+
+class RuleEngine:
+    """A rule table compiled into shared condition checks and per-slot rule lists."""
+
+    def __init__(self, rules: Tuple[Rule, ...]) -> None:
+        self.rules = rules
+        atom_index: Dict[Condition, int] = {}
+        self._atoms: List[tuple] = []  # (field getter, op function, value)
+        self._fields: List[str] = []
+        rule_atoms: Dict[str, Tuple[int, ...]] = {}
+        for rule in rules:
+            indexes = []
+            for cond in rule.when:
+                field, op, value = cond
+                if op not in _OPS:
+                    raise ValueError(f"Rule {rule.id}: unknown operator {op!r}")
+                if cond not in atom_index:
+                    atom_index[cond] = len(self._atoms)
+                    self._atoms.append((operator.attrgetter(field), _OPS[op], value))
+                    self._fields.append(field)
+                indexes.append(atom_index[cond])
+            if rule.id in rule_atoms and rule_atoms[rule.id] != tuple(indexes):
+                raise ValueError(f"Rule {rule.id} is defined twice with different conditions")
+            rule_atoms[rule.id] = tuple(indexes)
+        self.rule_ids: Tuple[str, ...] = tuple(rule_atoms)
+        self._rule_atoms = rule_atoms
+        # Bit masks over the condition list: a rule fires when all of its bits are set
+        self._rule_masks = {rid: sum(1 << i for i in set(idx)) for rid, idx in rule_atoms.items()}
+        # slot -> (every match?, [(rule, mask)])
+        self._slots: Dict[str, Tuple[bool, List[Tuple[Rule, int]]]] = {}
+        for slot, mode in SLOT_MODES.items():
+            entries = [(rule, self._rule_masks[rule.id]) for rule in rules if rule.slot == slot]
+            if mode == "one" and (not entries or entries[-1][1]):
+                raise ValueError(f"Slot {slot} needs an unconditional last rule")
+            self._slots[slot] = (mode == "all", entries)
+        unknown = {rule.slot for rule in rules if rule.slot is not None} - set(SLOT_MODES)
+        if unknown:
+            raise ValueError(f"Unknown rule slots: {sorted(unknown)}")
+
+    def conditions(self, m: Any) -> int:
+        """Every distinct condition checked once for one BudgetMetrics, as a bit mask (input to select/render)."""
+        bits = 0
+        bit = 1
+        for get, op, value in self._atoms:
+            if op(get(m), value):
+                bits |= bit
+            bit <<= 1
+        return bits
+
+    def evaluate(self, m: Any) -> Dict[str, bool]:
+        """{rule id: fired} for one BudgetMetrics."""
+        bits = self.conditions(m)
+        return {rid: bits & mask == mask for rid, mask in self._rule_masks.items()}
+
+    def evaluate_batch(self, batch: Any) -> Dict[str, Any]:
+        """{rule id: bool array over the budgets} for a BudgetMetricsBatch."""
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is not installed (pip install numpy)")
+        conds = [np.asarray(op(getattr(batch, field), value)) for field, (_get, op, value) in zip(self._fields, self._atoms)]
+        out = {}
+        for rid, idx in self._rule_atoms.items():
+            fired = np.ones(batch.size, dtype=bool)
+            for i in idx:
+                fired &= conds[i]
+            out[rid] = fired
+        return out
+
+    def select(self, slot: str, bits: int) -> List[Rule]:
+        """Matching rules for a slot, given conditions()'s result."""
+        take_all, entries = self._slots[slot]
+        if take_all:
+            return [rule for rule, mask in entries if bits & mask == mask]
+        for rule, mask in entries:
+            if bits & mask == mask:
+                return [rule]
+        return []
+
+    def render(self, slot: str, bits: int, context: Dict[str, Any]) -> List[str]:
+        return [rule.text.format_map(context) for rule in self.select(slot, bits)]
+
+
+RULE_ENGINE = RuleEngine(RULES)
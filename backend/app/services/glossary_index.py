@@ -0,0 +1,285 @@
+"""
+In-memory search index for the glossary.
+
+`GET /api/glossary?search=` used to lowercase and substring-scan every term and definition on
+every request, and the id / name lookups were linear scans too. The index is built once when
+the glossary loads:
+
+    by id        term id -> term
+    by name      casefolded term name -> term (explain_term's base definition)
+    by category  category -> positions, in glossary order
+    inverted     token -> {position: weighted term frequency}, plus a sorted vocabulary so a
+                 query token also matches every token it is a prefix of ("compo" -> "compound")
+
+Search ranks with BM25. Tokens in the term name count NAME_WEIGHT times, so "Bond" ranks the
+Bond entry above definitions that merely mention bonds. Every query token must match (by
+prefix); only postings of the query's tokens are read, never the whole glossary.
+
+Misspellings ("diversificaton", "compund interest") are resolved by trigram indexes over the
+term names and the search vocabulary: trigram overlap picks a few candidates, and a bounded
+edit distance (insert / delete / substitute / swap) confirms them. Words of 3 characters or
+fewer are never corrected, so "etc" does not become "ETF".
+"""
+
+import math
+import re
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+NAME_WEIGHT = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+# A prefix-only match ("compo" -> "compound") scores a little below typing the whole word
+PREFIX_PENALTY = 0.8
+# Shorter words are not auto-corrected: one edit usually spells another word ("stick" -> "stock")
+AUTOCORRECT_MIN_LENGTH = 6
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.casefold())
+
+
+def max_typos(text: str) -> int:
+    """Edit distance tolerated for a word or name of this length."""
+    n = len(text)
+    return 0 if n <= 3 else 1 if n <= 5 else 2 if n <= 12 else 3
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal-string-alignment distance (adjacent swaps cost 1), or limit + 1 as soon as it is
+    certain to exceed `limit`. Typos usually sit in a short middle stretch, so the common prefix
+    and suffix are dropped first and only a band of width 2 * limit + 1 is computed.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        return min(len(a) + len(b), limit + 1)
+
+    big = limit + 1
+    n = len(b)
+    prev2: List[int] = []
+    prev = [j if j <= limit else big for j in range(n + 1)]
+    for i in range(1, len(a) + 1):
+        ca = a[i - 1]
+        lo, hi = max(1, i - limit), min(n, i + limit)
+        row = [big] * (n + 1)
+        if i <= limit:
+            row[0] = i
+        for j in range(lo, hi + 1):
+            cb = b[j - 1]
+            best = prev[j - 1] + (ca != cb)
+            if prev[j] + 1 < best:
+                best = prev[j] + 1
+            if row[j - 1] + 1 < best:
+                best = row[j - 1] + 1
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb and prev2[j - 2] + 1 < best:
+                best = prev2[j - 2] + 1
+            row[j] = best
+        if min(row) > limit:
+            return big
+        prev2, prev = prev, row
+    return min(prev[n], big)
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Candidates within a bounded edit distance of a query, out of a fixed list of strings."""
+
+    def __init__(self, strings: Iterable[str]) -> None:
+        self.strings: List[str] = list(strings)
+        self._grams: Dict[str, List[int]] = {}
+        for i, text in enumerate(self.strings):
+            for gram in _trigrams(text):
+                self._grams.setdefault(gram, []).append(i)
+
+    def closest(self, query: str, limit: int = 1) -> List[Tuple[int, str]]:
+        """Up to `limit` (distance, string) pairs within max_typos(query), closest first."""
+        typos = max_typos(query)
+        if typos == 0:
+            return []
+        grams = _trigrams(query)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for i in self._grams.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        # Each edit changes at most 3 trigrams, so real matches keep at least this many
+        needed = max(1, len(grams) - 3 * typos)
+        found = []
+        for i, count in shared.items():
+            if count >= needed:
+                distance = edit_distance(query, self.strings[i], typos)
+                if distance <= typos:
+                    found.append((distance, -count, i))
+        found.sort()
+        return [(distance, self.strings[i]) for distance, _count, i in found[:limit]]
+
+
+class GlossaryIndex:
+    """Read-only index over a list of glossary term dicts (id, term, definition, category)."""
+
+    def __init__(self, terms: Iterable[Dict[str, Any]]) -> None:
+        self.terms: List[Dict[str, Any]] = list(terms)
+        self.by_id: Dict[int, Dict[str, Any]] = {}
+        self.by_name: Dict[str, Dict[str, Any]] = {}
+        self.by_category: Dict[str, List[int]] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: List[int] = []
+        for pos, term in enumerate(self.terms):
+            self.by_id[term["id"]] = term
+            self.by_name.setdefault(term["term"].strip().casefold(), term)
+            self.by_category.setdefault(term.get("category", ""), []).append(pos)
+            counts: Dict[str, int] = {}
+            for token in tokenize(term["term"]):
+                counts[token] = counts.get(token, 0) + NAME_WEIGHT
+            for token in tokenize(term.get("definition", "")):
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                self._postings.setdefault(token, {})[pos] = tf
+            self._lengths.append(sum(counts.values()))
+        self._category_sets = {category: set(positions) for category, positions in self.by_category.items()}
+        self._vocabulary: List[str] = sorted(self._postings)
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        n = len(self.terms)
+        self._idf = {
+            token: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5)) for token, docs in self._postings.items()
+        }
+        self._fuzzy_names = TrigramIndex(self.by_name)
+        self._fuzzy_words = TrigramIndex(self._vocabulary)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def get(self, term_id: int) -> Optional[Dict[str, Any]]:
+        return self.by_id.get(term_id)
+
+    def find_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        return self.by_name.get(name.strip().casefold())
+
+    def fuzzy_find(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        The term whose name is `name`, allowing only clear typos ("diversificaton"); None otherwise.
+
+        A typo is resolved when each misspelled word is one edit from the term's word, is long
+        enough that one edit rarely spells another word (AUTOCORRECT_MIN_LENGTH), is not itself a
+        word the glossary uses, and no other term name is nearly as close. "Deflation", "Stick"
+        and "Bold" stay unresolved; did_you_mean() still suggests the near names.
+        """
+        key = " ".join(name.casefold().split())
+        term = self.by_name.get(key)
+        if term is not None:
+            return term
+        closest = self._fuzzy_names.closest(key, limit=2)
+        if not closest:
+            return None
+        distance, match = closest[0]
+        if len(closest) > 1 and closest[1][0] - distance < 2:
+            return None  # ambiguous: another name is about as close
+        words, target = key.split(), match.split()
+        if len(words) != len(target):
+            return None
+        for word, expected in zip(words, target):
+            if word == expected:
+                continue
+            if (
+                len(word) < AUTOCORRECT_MIN_LENGTH
+                or word in self._idf
+                or edit_distance(word, expected, 1) > 1
+            ):
+                return None
+        return self.by_name[match]
+
+    def correct_query(self, query: str) -> str:
+        """`query` with each unknown word replaced by the closest indexed word ("compund" -> "compound")."""
+        words = []
+        for token in tokenize(query):
+            if token not in self._idf and not self._expand(token):
+                closest = self._fuzzy_words.closest(token)
+                if closest:
+                    token = closest[0][1]
+            words.append(token)
+        return " ".join(words)
+
+    def did_you_mean(self, query: str, limit: int = 3) -> List[str]:
+        """Term names to suggest when `query` finds nothing as typed."""
+        names: List[str] = []
+        for _distance, name in self._fuzzy_names.closest(" ".join(query.casefold().split()), limit=limit):
+            names.append(self.by_name[name]["term"])
+        corrected = self.correct_query(query)
+        if corrected and corrected != " ".join(tokenize(query)):
+            for match in self.search(corrected, limit=limit)[0]:
+                if match["term"] not in names:
+                    names.append(match["term"])
+        return names[:limit]
+
+    def _expand(self, token: str) -> List[str]:
+        """
+        Every vocabulary token starting with `token` (the exact token first, if present). Not capped:
+        a short prefix matches many words, but dropping some would silently lose results and totals.
+        """
+        start = bisect_left(self._vocabulary, token)
+        return self._vocabulary[start:bisect_left(self._vocabulary, token + "\U0010ffff", start)]
+
+    def _bm25(self, token: str, pos: int, tf: int) -> float:
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[pos] / self._avg_length)
+        return self._idf[token] * tf * (BM25_K1 + 1) / (tf + norm)
+
+    def _token_scores(self, token: str) -> Dict[int, float]:
+        """Best score per document for one query token across its prefix expansions."""
+        scores: Dict[int, float] = {}
+        for word in self._expand(token):
+            factor = 1.0 if word == token else PREFIX_PENALTY
+            for pos, tf in self._postings[word].items():
+                score = self._bm25(word, pos, tf) * factor
+                if score > scores.get(pos, 0.0):
+                    scores[pos] = score
+        return scores
+
+    def search(
+        self,
+        query: str = "",
+        category: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        (page of matching terms, total matches). With a query, best BM25 score first (glossary
+        order breaks ties); without one, glossary order.
+        """
+        allowed = None
+        if category:
+            allowed = self.by_category.get(category, [])
+        tokens = tokenize(query)
+        if not tokens:
+            positions = list(range(len(self.terms))) if allowed is None else allowed
+        else:
+            totals: Optional[Dict[int, float]] = None
+            # Rarest token first keeps the running intersection small
+            for scores in sorted((self._token_scores(t) for t in dict.fromkeys(tokens)), key=len):
+                if totals is None:
+                    totals = scores
+                else:
+                    totals = {pos: total + scores[pos] for pos, total in totals.items() if pos in scores}
+                if not totals:
+                    break
+            if allowed is not None:
+                allowed_set = self._category_sets.get(category, set())
+                totals = {pos: score for pos, score in totals.items() if pos in allowed_set}
+            positions = sorted(totals, key=lambda pos: (-totals[pos], pos))
+        total = len(positions)
+        end = None if limit is None else offset + limit
+        return [self.terms[pos] for pos in positions[offset:end]], total
@@ -0,0 +1,335 @@
+"""
+Prometheus metrics for the AI endpoints and their fallbacks, served at GET /metrics.
+
+Until now the only signal was `print(f"AI Service Error ...")`. These series answer how slow
+each endpoint is, which backend answered it, how often the deterministic fallback was served
+and how many Gemini tokens it cost:
+
+    ai_request_duration_seconds{endpoint, output_source}   histogram per AI request; the answer's
+        output_source, or "cache" / "store" when no model call was needed. Fallback rate:
+        rate(..._count{output_source="fallback_deterministic"}) / rate(..._count)
+    ai_requests_in_flight{endpoint}
+    ai_upstream_calls_total{endpoint, backend, outcome}    ok, empty, error, cancelled, circuit_open
+    ai_upstream_duration_seconds{endpoint, backend}        histogram per Gemini call
+    ai_upstream_in_flight{backend}
+    ai_tokens_total{endpoint, backend, kind}               prompt / completion, from usage_metadata
+
+Cache, single-flight, pre-grader and circuit-breaker series are read from their `stats()` at
+scrape time (see main.py), so they cost nothing per request.
+
+Recording never takes a lock: every thread writes only its own shard (a plain dict), and a
+scrape sums the shards. Shards of threads that have exited are folded into a retired total,
+so the dev server's thread-per-request does not grow the list. Numbers are per process; under
+gunicorn each worker is its own scrape target.
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; wide enough for a cache hit (ms) and a slow Gemini answer (10 s+)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (metric name, type, help, labels, value) for series computed at scrape time
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+class _Shard:
+    __slots__ = ("thread", "counters", "histograms")
+
+    def __init__(self, thread: threading.Thread) -> None:
+        self.thread = thread
+        self.counters: Dict[tuple, float] = {}
+        # key -> per-bucket counts (last one is +Inf), then the sum of observed values
+        self.histograms: Dict[tuple, List[float]] = {}
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        # Guards the shard list and the retired totals; taken once per thread and per scrape
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._retired_counters: Dict[tuple, float] = {}
+        self._retired_histograms: Dict[tuple, List[float]] = {}
+        self._families: Dict[str, Tuple[str, str, Tuple[str, ...], Tuple[float, ...]]] = {}
+
+    def _shard(self) -> _Shard:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _register(self, name: str, kind: str, help_text: str, labels: Tuple[str, ...], buckets=()) -> None:
+        if name in self._families:
+            raise ValueError(f"metric {name} is already registered")
+        self._families[name] = (kind, help_text, labels, tuple(buckets))
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...]) -> "Counter":
+        self._register(name, "counter", help_text, labels)
+        return Counter(self, name)
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...]) -> "Gauge":
+        self._register(name, "gauge", help_text, labels)
+        return Gauge(self, name)
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...], buckets=LATENCY_BUCKETS) -> "Histogram":
+        self._register(name, "histogram", help_text, labels, buckets)
+        return Histogram(self, name, tuple(buckets))
+
+    def snapshot(self) -> Tuple[Dict[tuple, float], Dict[tuple, List[float]]]:
+        """Totals over every shard (live and retired)."""
+        with self._lock:
+            live = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    live.append(shard)
+                else:
+                    # The thread is gone, so nothing writes this shard any more
+                    _merge(self._retired_counters, self._retired_histograms, shard.counters, shard.histograms)
+            self._shards = live
+            counters = dict(self._retired_counters)
+            histograms = {key: list(values) for key, values in self._retired_histograms.items()}
+        for shard in live:
+            # dict.copy is atomic under the GIL; the owner may keep writing meanwhile
+            _merge(counters, histograms, shard.counters.copy(), shard.histograms.copy())
+        return counters, histograms
+
+    def render(self, extra: Iterable[Sample] = ()) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        counters, histograms = self.snapshot()
+        lines: List[str] = []
+        for name, (kind, help_text, label_names, buckets) in self._families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                for (metric, labels), values in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    pairs = list(zip(label_names, labels))
+                    cumulative = 0.0
+                    for bound, count in zip(buckets + (float("inf"),), values):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _number(bound)
+                        lines.append(f"{name}_bucket{_labels(pairs + [('le', le)])} {_number(cumulative)}")
+                    lines.append(f"{name}_sum{_labels(pairs)} {_number(values[-1])}")
+                    lines.append(f"{name}_count{_labels(pairs)} {_number(cumulative)}")
+            else:
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(zip(label_names, labels))} {_number(value)}")
+
+        grouped: Dict[str, Tuple[str, str, List[str]]] = {}
+        for name, kind, help_text, labels, value in extra:
+            family = grouped.setdefault(name, (kind, help_text, []))
+            family[2].append(f"{name}{_labels(labels.items())} {_number(value)}")
+        for name, (kind, help_text, samples) in grouped.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def _merge(counters, histograms, more_counters, more_histograms) -> None:
+    for key, value in more_counters.items():
+        counters[key] = counters.get(key, 0) + value
+    for key, values in more_histograms.items():
+        total = histograms.get(key)
+        if total is None:
+            histograms[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                total[i] += value
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs) -> str:
+    body = ",".join(f'{key}="{_escape(value)}"' for key, value in pairs)
+    return f"{{{body}}}" if body else ""
+
+
+def _number(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry: MetricsRegistry, name: str) -> None:
+        self._registry = registry
+        self._name = name
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        values = self._registry._shard().counters
+        key = (self._name, labels)
+        values[key] = values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    """Summed across shards like a counter, so an inc and its dec may run on different threads."""
+
+    __slots__ = ()
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    __slots__ = ("_registry", "_name", "_buckets")
+
+    def __init__(self, registry: MetricsRegistry, name: str, buckets: Tuple[float, ...]) -> None:
+        self._registry = registry
+        self._name = name
+        self._buckets = buckets
+
+    def observe(self, value: float, *labels: str) -> None:
+        values = self._registry._shard().histograms
+        key = (self._name, labels)
+        counts = values.get(key)
+        if counts is None:
+            counts = values[key] = [0] * (len(self._buckets) + 1) + [0.0]
+        counts[bisect_left(self._buckets, value)] += 1
+        counts[-1] += value
+
+
+METRICS = MetricsRegistry()
+
+REQUEST_LATENCY = METRICS.histogram(
+    "ai_request_duration_seconds", "AI endpoint requests by who produced the answer.", ("endpoint", "output_source")
+)
+REQUESTS_IN_FLIGHT = METRICS.gauge("ai_requests_in_flight", "AI endpoint requests being served.", ("endpoint",))
+UPSTREAM_CALLS = METRICS.counter(
+    "ai_upstream_calls_total", "Gemini calls by outcome (ok, empty, error, cancelled, circuit_open).", ("endpoint", "backend", "outcome")
+)
+UPSTREAM_LATENCY = METRICS.histogram(
+    "ai_upstream_duration_seconds", "Gemini call latency, failures included.", ("endpoint", "backend")
+)
+UPSTREAM_IN_FLIGHT = METRICS.gauge("ai_upstream_in_flight", "Gemini calls waiting on the network.", ("backend",))
+TOKENS = METRICS.counter("ai_tokens_total", "Gemini tokens used (kind: prompt, completion).", ("endpoint", "backend", "kind"))
+
+
+class RequestTimer:
+    """
+    Times one AI request: `with RequestTimer("chat") as req: ...; req.source = "google_ai_studio"`.
+    An exception that escapes is recorded with output_source="error".
+    """
+
+    __slots__ = ("endpoint", "source", "started")
+
+    def __init__(self, endpoint: str) -> None:
+        self.endpoint = endpoint
+        self.source = "unknown"
+        self.started = 0.0
+
+    def __enter__(self) -> "RequestTimer":
+        REQUESTS_IN_FLIGHT.inc(self.endpoint)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        REQUESTS_IN_FLIGHT.dec(self.endpoint)
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - self.started, self.endpoint, "error" if exc_type is not None else self.source
+        )
+        return False
+
+    def finish(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Label from an ai_service result dict (`output_source`, `cache_hit`); returns it unchanged."""
+        self.source = "cache" if result.get("cache_hit") else result.get("output_source", "unknown")
+        return result
+
+
+def timed_request(endpoint: str):
+    """Decorator for ai_service entry points (sync or async) that return a result dict."""
+
+    def wrap(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args, **kwargs):
+                with RequestTimer(endpoint) as req:
+                    return req.finish(await fn(*args, **kwargs))
+
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with RequestTimer(endpoint) as req:
+                return req.finish(fn(*args, **kwargs))
+
+        return run
+
+    return wrap
+
+
+class UpstreamCall:
+    """
+    Wraps one Gemini call: `with UpstreamCall("analyze", "vertex_ai") as call: call.response = ...`.
+    Set `outcome = "empty"` for a blank answer. An exception that escapes counts as "error", except
+    a deadline cancellation or a client leaving a stream, which count as "cancelled".
+    """
+
+    __slots__ = ("endpoint", "backend", "outcome", "response", "started")
+
+    def __init__(self, endpoint: str, backend: str) -> None:
+        self.endpoint = endpoint
+        self.backend = backend
+        self.outcome = "ok"
+        self.response: Optional[Any] = None
+        self.started = 0.0
+
+    def __enter__(self) -> "UpstreamCall":
+        UPSTREAM_IN_FLIGHT.inc(self.backend)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - self.started, self.endpoint, self.backend)
+        UPSTREAM_IN_FLIGHT.dec(self.backend)
+        if exc_type is None:
+            outcome = self.outcome
+        elif issubclass(exc_type, (GeneratorExit, asyncio.CancelledError)):
+            outcome = "cancelled"
+        else:
+            outcome = "error"
+        UPSTREAM_CALLS.inc(self.endpoint, self.backend, outcome)
+        record_tokens(self.endpoint, self.backend, self.response)
+        return False
+
+
+def record_tokens(endpoint: str, backend: str, response: Any) -> None:
+    """Token counts from a response's usage_metadata (both SDKs); silently skipped when absent."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_token_count", 0) or 0
+    completion = getattr(usage, "candidates_token_count", 0) or 0
+    if prompt:
+        TOKENS.inc(endpoint, backend, "prompt", amount=prompt)
+    if completion:
+        TOKENS.inc(endpoint, backend, "completion", amount=completion)
+
+
+def circuit_open(endpoint: str, backend: str) -> None:
+    UPSTREAM_CALLS.inc(endpoint, backend, "circuit_open")
+
+
+def cache_samples(cache: str, hits: float, misses: float, entries: float) -> List[Sample]:
+    labels = {"cache": cache}
+    return [
+        ("ai_cache_hits_total", "counter", "Lookups answered from the cache.", labels, hits),
+        ("ai_cache_misses_total", "counter", "Lookups that missed the cache.", labels, misses),
+        ("ai_cache_entries", "gauge", "Entries held in memory.", labels, entries),
+    ]
@@ -0,0 +1,134 @@
+"""
+Process-wide registry of configured Gemini model objects.
+
+Building a `GenerativeModel` (and calling `genai.configure` / `vertexai.init`) on every request
+repeats client setup and drops pooled transports. The registry creates each model once per
+(backend, model name, generation config) and hands the same object to every thread.
+
+Credentials are read from the environment on each lookup; if `GEMINI_API_KEY`,
+`GEMINI_API_ENDPOINT`, `GOOGLE_CLOUD_PROJECT` or `GOOGLE_CLOUD_LOCATION` change, every cached
+model is dropped and the SDKs are configured again on next use.
+
+The registry lock only guards the dict: SDK setup runs under a lock per backend and model building
+under a lock per key, so a slow cold start of one model does not hold up lookups of the others.
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# Env vars that decide which account/project a cached client talks to
+CREDENTIAL_ENV_VARS = ("GEMINI_API_KEY", "GEMINI_API_ENDPOINT", "GOOGLE_CLOUD_PROJECT", "GOOGLE_CLOUD_LOCATION")
+
+
+def _credential_fingerprint() -> Tuple[str, ...]:
+    return tuple(os.getenv(name, "").strip() for name in CREDENTIAL_ENV_VARS)
+
+
+class ModelRegistry:
+    """Thread-safe cache of model objects keyed by (backend, model name, generation config)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._models: Dict[Hashable, Any] = {}
+        self._configured: set = set()
+        # Serialize configure() per backend and factory() per key, outside self._lock
+        self._backend_locks: Dict[str, threading.Lock] = {}
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        # Bumped whenever cached models are dropped; a model built across a bump is not kept
+        self._generation = 0
+        self._fingerprint: Optional[Tuple[str, ...]] = None
+        self._hits = 0
+        self._misses = 0
+        self._resets = 0
+
+    def _check_credentials(self) -> None:
+        """Drop everything if credentials changed since the last lookup. Caller holds the lock."""
+        fingerprint = _credential_fingerprint()
+        if fingerprint != self._fingerprint:
+            if self._fingerprint is not None:
+                self._resets += 1
+            self._models.clear()
+            self._configured.clear()
+            self._generation += 1
+            self._fingerprint = fingerprint
+
+    def get(
+        self,
+        backend: str,
+        model_name: str,
+        generation_config: Tuple[Tuple[str, Any], ...],
+        factory: Callable[[], Any],
+        configure: Optional[Callable[[], None]] = None,
+    ) -> Any:
+        """
+        Return the cached model for this key, creating it with `factory()` on first use.
+
+        `configure` runs once per backend per credential set (e.g. `genai.configure`), before the
+        first model of that backend is built.
+        """
+        key = (backend, model_name, generation_config)
+        model = self._cached(key, count_miss=False)
+        if model is not None:
+            return model
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+            backend_lock = self._backend_locks.setdefault(backend, threading.Lock())
+        with key_lock:
+            # Another thread may have built it while we waited
+            model = self._cached(key, count_miss=True)
+            if model is not None:
+                return model
+            with self._lock:
+                generation = self._generation
+            if configure is not None:
+                with backend_lock:
+                    with self._lock:
+                        needed = backend not in self._configured
+                    if needed:
+                        configure()
+                        with self._lock:
+                            if self._generation == generation:
+                                self._configured.add(backend)
+            model = factory()
+            with self._lock:
+                if self._generation == generation:
+                    self._models[key] = model
+            return model
+
+    def _cached(self, key: Hashable, count_miss: bool) -> Any:
+        """The cached model or None; counts a hit, and a miss when `count_miss`."""
+        with self._lock:
+            self._check_credentials()
+            model = self._models.get(key)
+            if model is not None:
+                self._hits += 1
+            elif count_miss:
+                self._misses += 1
+            return model
+
+    def reset(self) -> None:
+        """Forget every cached model (next lookup reconfigures the SDKs)."""
+        with self._lock:
+            self._models.clear()
+            self._configured.clear()
+            self._generation += 1
+            self._fingerprint = None
+            self._resets += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "resets": self._resets,
+                "cached_models": [
+                    {"backend": b, "model": m, "generation_config": dict(cfg)}
+                    for (b, m, cfg) in self._models
+                ],
+            }
+
+
+MODEL_REGISTRY = ModelRegistry()
@@ -0,0 +1,202 @@
+"""
+Local pre-grader for quiz answers.
+
+Most quiz questions ask for a number the answer key already states ("what share of income is
+the $900 savings line?" -> "10%"). Grading those with a 2000-token Gemini call is slow and
+spends quota for nothing. The pre-grader pulls the numbers (percents, dollar amounts, ranges
+like "15–20%") and financial_rules.md rule names out of the question, key and student answer,
+and decides locally only when it is confident:
+
+    CORRECT    every number the key adds beyond the question's givens is in the answer, the
+               answer has no other numbers, no negation, and names no rule the key doesn't
+    INCORRECT  a short answer with an amount of the key's kind (percent, dollars) that matches
+               nothing in the question or key
+
+Everything else (conceptual answers, partial matches, long explanations) returns None and goes
+to the model as before.
+
+    QUIZ_PREGRADE=0    disable (every answer goes to the model)
+"""
+
+import os
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+# Answers with more words than this are explanations; never marked INCORRECT locally
+SHORT_ANSWER_WORDS = 12
+
+_NUM = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+"
+_PCT = r"\s*(?:%|percent\b|pct\b)"
+_VALUE_RE = re.compile(
+    rf"(?P<dollar>\$\s*)?(?P<lo>{_NUM})(?P<lo_k>k\b)?(?P<lo_pct>{_PCT})?"
+    rf"(?:\s*(?:-|–|—|to)\s*\$?\s*(?P<hi>{_NUM})(?P<hi_k>k\b)?(?P<hi_pct>{_PCT})?)?"
+    r"(?P<usd>\s*(?:dollars?|usd)\b)?",
+    re.IGNORECASE,
+)
+_NEGATION_RE = re.compile(r"\b(?:not|no|never|isn't|aren't|wasn't|don't|doesn't|shouldn't)\b|n't\b", re.IGNORECASE)
+
+# Canonical rule names (docs/financial_rules.md) and how answers tend to spell them
+_RULE_PATTERNS = {
+    "50/30/20": r"50\s*/\s*30\s*/\s*20",
+    "Savings Benchmarks": r"savings\s+benchmarks?",
+    "Emergency Fund": r"emergency\s+funds?",
+    "Housing 30%": r"housing\s+(?:~?\s*30\s*%\s+)?(?:guideline|rule)",
+}
+_RULE_RE = re.compile("|".join(f"(?P<r{i}>{p})" for i, p in enumerate(_RULE_PATTERNS.values())), re.IGNORECASE)
+_RULE_NAMES = tuple(_RULE_PATTERNS)
+
+
+class Value(NamedTuple):
+    kind: str  # "percent", "dollar" or "number"
+    lo: float
+    hi: float  # == lo unless this is a range
+    text: str
+
+
+def _number(raw: str, thousands: Optional[str]) -> float:
+    n = float(raw.replace(",", ""))
+    return n * 1000 if thousands else n
+
+
+def rule_names(text: str) -> Set[str]:
+    """Rule names from financial_rules.md mentioned in `text`."""
+    return {_RULE_NAMES[int(m.lastgroup[1:])] for m in _RULE_RE.finditer(text)}
+
+
+def extract_values(text: str) -> List[Value]:
+    """Percents, dollar amounts, plain numbers and ranges in `text` (rule names like 50/30/20 excluded)."""
+    text = _RULE_RE.sub(" ", text)
+    values = []
+    for m in _VALUE_RE.finditer(text):
+        lo = _number(m.group("lo"), m.group("lo_k"))
+        hi = _number(m.group("hi"), m.group("hi_k")) if m.group("hi") else lo
+        if m.group("lo_pct") or m.group("hi_pct"):
+            kind = "percent"
+        elif m.group("dollar") or m.group("usd"):
+            kind = "dollar"
+        else:
+            kind = "number"
+        values.append(Value(kind, min(lo, hi), max(lo, hi), m.group(0).strip()))
+    return values
+
+
+def _format_number(n: float) -> str:
+    return format(n, ".10g")
+
+
+def _canonical_value(m: "re.Match[str]") -> str:
+    (value,) = extract_values(m.group(0))
+    span = _format_number(value.lo) if value.lo == value.hi else f"{_format_number(value.lo)}-{_format_number(value.hi)}"
+    if value.kind == "percent":
+        return span + "%"
+    return "$" + span if value.kind == "dollar" else span
+
+
+def normalize_text(text: str) -> str:
+    """
+    Fingerprint form of a question, key or answer: casefolded, whitespace collapsed, trailing
+    punctuation dropped and numbers canonical, so "15 to 20 Percent." and "15–20%" are equal.
+    """
+    text = " ".join(text.casefold().split()).rstrip(" .!?;:")
+    return _VALUE_RE.sub(_canonical_value, text)
+
+
+def _close(a: float, b: float, kind: str) -> bool:
+    if kind == "percent":
+        return abs(a - b) <= 0.5  # rounding 7.5% to 8% is fine
+    return abs(a - b) <= max(0.5, 0.005 * abs(b))
+
+
+def same_value(a: Value, b: Value) -> bool:
+    """True if `a` and `b` are the same amount; a plain number matches a percent or dollar amount."""
+    if a.kind != b.kind and "number" not in (a.kind, b.kind):
+        return False
+    kind = "percent" if "percent" in (a.kind, b.kind) else "dollar"
+    if _close(a.lo, b.lo, kind) and _close(a.hi, b.hi, kind):
+        return True
+    # A fraction written for a percent: 0.1 for 10%
+    number, percent = (a, b) if a.kind == "number" else (b, a)
+    return (
+        kind == "percent" and number.kind == "number" and number.hi <= 1
+        and _close(number.lo * 100, percent.lo, kind) and _close(number.hi * 100, percent.hi, kind)
+    )
+
+
+def _matches_any(value: Value, pool: List[Value]) -> bool:
+    return any(same_value(value, other) for other in pool)
+
+
+def pregrade(quiz_question: str, quiz_answer_key: str, user_answer: str) -> Optional[Tuple[str, str]]:
+    """(verdict, feedback) when the answer can be graded locally with confidence, else None."""
+    given = extract_values(quiz_question)
+    key_values = extract_values(quiz_answer_key)
+    # The answer the key expects = the numbers it adds beyond what the question already states
+    targets = [v for v in key_values if not _matches_any(v, given)]
+    answer = extract_values(user_answer)
+    if not targets or not answer or _NEGATION_RE.search(user_answer):
+        return None
+
+    hits = [t for t in targets if _matches_any(t, answer)]
+    stray = [a for a in answer if not _matches_any(a, key_values) and not _matches_any(a, given)]
+    answer_rules = rule_names(user_answer)
+    wrong_rule = bool(answer_rules) and not (answer_rules & rule_names(quiz_question + "\n" + quiz_answer_key))
+    shown = ", ".join(v.text for v in answer)
+
+    if len(hits) == len(targets) and not stray and not wrong_rule:
+        return "CORRECT", (
+            f"Correct — your answer matches the answer key ({shown}). Compare your reasoning with the "
+            "key to make sure the rule behind the numbers is clear."
+        )
+    # Only a wrong amount of the kind the key expects counts ("reason number 3" is not a wrong percent)
+    wrong = [a for a in stray if any(a.kind == t.kind for t in targets)]
+    if not hits and wrong and len(user_answer.split()) <= SHORT_ANSWER_WORDS:
+        return "INCORRECT", (
+            f"Not quite — {shown} does not match the answer key. Recheck the math using the numbers in "
+            "the question and the rule it cites, then compare with the key."
+        )
+    return None
+
+
+class QuizPreGrader:
+    """`pregrade` plus counters of how many model calls it saved (thread-safe)."""
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._correct = 0
+        self._incorrect = 0
+        self._deferred = 0
+
+    def grade(self, quiz_question: str, quiz_answer_key: str, user_answer: str) -> Optional[Dict[str, Any]]:
+        """A grade result ({verdict, feedback, output_source}), or None when the model must decide."""
+        if not self.enabled or not quiz_answer_key:
+            return None
+        local = pregrade(quiz_question, quiz_answer_key, user_answer)
+        with self._lock:
+            if local is None:
+                self._deferred += 1
+            elif local[0] == "CORRECT":
+                self._correct += 1
+            else:
+                self._incorrect += 1
+        if local is None:
+            return None
+        verdict, feedback = local
+        return {"verdict": verdict, "feedback": feedback, "output_source": "local_pregrader"}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            saved = self._correct + self._incorrect
+            seen = saved + self._deferred
+            return {
+                "enabled": self.enabled,
+                "graded_correct": self._correct,
+                "graded_incorrect": self._incorrect,
+                "sent_to_llm": self._deferred,
+                "llm_calls_saved": saved,
+                "saved_ratio": round(saved / seen, 3) if seen else 0.0,
+            }
+
+
+QUIZ_PREGRADER = QuizPreGrader(enabled=os.getenv("QUIZ_PREGRADE", "1").strip().lower() not in ("0", "false", "no"))
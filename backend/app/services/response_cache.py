@@ -0,0 +1,129 @@
+"""
+Bounded LRU + TTL cache for JSON-serializable AI responses.
+
+Values are stored as JSON text, so every `get` returns a fresh copy that callers may mutate.
+An optional SQLite file adds a second tier that survives restarts and is shared by every worker
+on the box; memory stays the first lookup and is capped at `max_entries`.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def content_key(payload: Any) -> str:
+    """Stable sha256 of a JSON-serializable payload (dict key order does not matter)."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """In-memory LRU with per-entry TTL, optionally backed by a SQLite table."""
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 512,
+        ttl_seconds: float = 900.0,
+        db_path: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (name, key))"
+            )
+            self._db.execute(
+                "DELETE FROM response_cache WHERE name = ? AND expires_at <= ?", (name, time.time())
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self._db is not None
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a copy of the cached value, or None if missing/expired."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, raw = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return json.loads(raw)
+                del self._entries[key]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM response_cache WHERE name = ? AND key = ?",
+                    (self.name, key),
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._disk_hits += 1
+                    self._remember(key, row[1], row[0])
+                    return json.loads(row[0])
+            self._misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        raw = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, raw)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO response_cache (name, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.name, key, raw, expires_at),
+                )
+
+    def _remember(self, key: str, expires_at: float, raw: str) -> None:
+        """Insert into the memory tier and evict least-recently-used entries. Caller holds the lock."""
+        if self.max_entries == 0:
+            return
+        self._entries[key] = (expires_at, raw)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM response_cache WHERE name = ?", (self.name,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": self._db is not None,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round((self._hits + self._disk_hits) / lookups, 4) if lookups else 0.0,
+            }
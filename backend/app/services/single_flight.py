@@ -0,0 +1,118 @@
+"""
+Single-flight: collapse concurrent identical calls into one.
+
+During a class demo dozens of clients submit the same sample budget (or the same quiz answer)
+within milliseconds. The first caller for a key runs the upstream call; everyone who arrives
+while it is still in flight waits for that result instead of starting their own. Nothing is
+remembered once the call finishes — that is the response cache's job.
+"""
+
+import asyncio
+import functools
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None  # type: ignore[assignment]
+        self.waiters = 0
+
+
+class _AsyncCall:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]") -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Thread-safe; exceptions from the leader are re-raised in every waiter."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, _AsyncCall] = {}
+        self._executions = 0
+        self._collapsed = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._collapsed += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Coroutine version for the ASGI serving mode. The shared call runs as its own task and every
+        caller, the first one included, awaits it through asyncio.shield: a caller that is cancelled
+        (client gone, wait_for deadline) leaves the call running for the others. Once no caller is
+        left the task is cancelled. This assumes one event loop per process (the normal
+        uvicorn/hypercorn worker setup).
+        """
+        call = self._async_calls.get(key)
+        if call is None:
+            call = _AsyncCall(asyncio.ensure_future(fn()))
+            self._async_calls[key] = call
+            call.task.add_done_callback(functools.partial(self._async_done, key, call))
+            with self._lock:
+                self._executions += 1
+        else:
+            with self._lock:
+                self._collapsed += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is left to read the result; later callers start a fresh call
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: "_AsyncCall") -> None:
+        if self._async_calls.get(key) is call:
+            del self._async_calls[key]
+
+    def _async_done(self, key: Hashable, call: "_AsyncCall", task: "asyncio.Task[Any]") -> None:
+        self._forget(key, call)
+        if not task.cancelled():
+            # Mark retrieved so an exception nobody awaited is not logged as "never retrieved"
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls) + len(self._async_calls),
+                "executions": self._executions,
+                "collapsed": self._collapsed,
+            }
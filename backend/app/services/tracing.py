@@ -0,0 +1,147 @@
+"""
+Per-request span tracing for the analyze pipeline.
+
+A trace covers one request; spans time its stages (payload parsing, validation, cache lookup,
+prompt building, the Gemini call, response parsing, JSON serialization). The active trace lives in
+a ContextVar, so it follows the request through Flask's thread and through ASGI coroutines, and
+`span()` outside a trace costs one ContextVar lookup.
+
+Every traced response carries a `Server-Timing` header (visible in the browser's network panel).
+A sample of traces is appended to a JSONL file, one object per request, for
+scripts/trace_summary.py to aggregate:
+
+    TRACE_SAMPLE_RATE=0.01          fraction of requests written (0 = none, 1 = all)
+    TRACE_FILE=traces.jsonl         relative paths are under backend/
+    TRACE_SERVER_TIMING=1           0 drops the header (e.g. when responses are public)
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+_BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+_CURRENT: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_NO_SPAN = nullcontext()
+_WRITE_LOCK = threading.Lock()
+
+
+class Trace:
+    """Spans of one request, as (name, start offset, duration, depth) in seconds, in finish order."""
+
+    __slots__ = ("name", "started_at", "started", "total", "status", "attributes", "spans", "depth", "_token")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.total: Optional[float] = None
+        self.status: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.spans: List[Tuple[str, float, float, int]] = []
+        self.depth = 0
+        self._token = None
+
+    def server_timing(self) -> str:
+        """`Server-Timing` value: each span, then the whole request as "total" (milliseconds)."""
+        parts = [f"{name};dur={duration * 1000:.2f}" for name, _start, duration, _depth in self.spans]
+        if self.total is not None:
+            parts.append(f"total;dur={self.total * 1000:.2f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ts": round(self.started_at, 3),
+            "name": self.name,
+            "status": self.status,
+            "total_ms": round((self.total or 0.0) * 1000, 3),
+            "attributes": self.attributes,
+            "spans": [
+                {"name": name, "start_ms": round(start * 1000, 3), "dur_ms": round(duration * 1000, 3), "depth": depth}
+                for name, start, duration, depth in sorted(self.spans, key=lambda s: (s[1], s[3]))
+            ],
+        }
+
+
+class _Span:
+    __slots__ = ("trace", "name", "started", "depth")
+
+    def __init__(self, trace: Trace, name: str) -> None:
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.depth = self.trace.depth
+        self.trace.depth += 1
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        ended = time.perf_counter()
+        trace = self.trace
+        trace.depth -= 1
+        trace.spans.append((self.name, self.started - trace.started, ended - self.started, self.depth))
+        return False
+
+
+def span(name: str):
+    """Context manager timing one stage of the current trace; a no-op when nothing is traced."""
+    trace = _CURRENT.get()
+    return _NO_SPAN if trace is None else _Span(trace, name)
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """Tag the current trace (e.g. output_source) so summaries can group by it."""
+    trace = _CURRENT.get()
+    if trace is not None:
+        trace.attributes[key] = value
+
+
+def start_trace(name: str) -> Trace:
+    trace = Trace(name)
+    trace._token = _CURRENT.set(trace)
+    return trace
+
+
+def finish_trace(trace: Trace, status: Optional[int] = None) -> Trace:
+    """Stop the clock, detach the trace from the context and write it if sampled."""
+    trace.total = time.perf_counter() - trace.started
+    trace.status = status
+    if trace._token is not None:
+        _CURRENT.reset(trace._token)
+        trace._token = None
+    rate = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+    if rate > 0 and (rate >= 1 or random.random() < rate):
+        write_trace(trace)
+    return trace
+
+
+def discard_trace(trace: Trace) -> None:
+    """Detach a trace without recording it (the request was handed to another traced handler)."""
+    if trace._token is not None:
+        _CURRENT.reset(trace._token)
+        trace._token = None
+
+
+def server_timing_enabled() -> bool:
+    return os.getenv("TRACE_SERVER_TIMING", "1").strip().lower() not in ("0", "false", "no")
+
+
+def trace_file() -> Path:
+    path = Path(os.getenv("TRACE_FILE", "traces.jsonl"))
+    return path if path.is_absolute() else _BACKEND_DIR / path
+
+
+def write_trace(trace: Trace) -> None:
+    line = json.dumps(trace.to_dict(), separators=(",", ":")) + "\n"
+    try:
+        with _WRITE_LOCK, open(trace_file(), "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        print(f"Trace not written ({trace_file()}): {e}")
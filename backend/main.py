@@ -1,7 +1,8 @@
 import os
+import threading
 from pathlib import Path
 
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 
@@ -9,6 +10,7 @@ _BACKEND_DIR = Path(__file__).resolve().parent
 load_dotenv(_BACKEND_DIR / ".env")
 
 from app.routes.budget import budget_bp
+from app.routes.chat import chat_bp
 from app.routes.glossary import glossary_bp
 
 
@@ -19,6 +21,13 @@ def create_app():
 
     app.register_blueprint(budget_bp, url_prefix='/api')
     app.register_blueprint(glossary_bp, url_prefix='/api')
+    app.register_blueprint(chat_bp, url_prefix='/api')
+
+    if os.getenv("AI_SDK_PREWARM", "").strip().lower() in ("1", "true", "yes"):
+        # The Gemini SDKs otherwise load on the first AI request; import them off the startup path
+        from app.services.ai_service import prewarm_ai_sdks
+
+        threading.Thread(target=prewarm_ai_sdks, name="ai-sdk-prewarm", daemon=True).start()
 
     @app.route('/', methods=['GET'])
     def home():
@@ -27,11 +36,14 @@ def create_app():
             "health": "/api/health",
             "analyze": "POST /api/analyze",
             "grade_quiz": "POST /api/grade-quiz",
+            "stats": "/api/stats",
+            "metrics": "/metrics",
         })
 
     @app.route('/api/health')
     def health_check():
         from app.services.ai_service import GENAI_STUDIO_AVAILABLE, VERTEX_AVAILABLE
+        from app.services.circuit_breaker import breaker_states
 
         key_set = bool(os.getenv("GEMINI_API_KEY", "").strip())
         project_set = bool(os.getenv("GOOGLE_CLOUD_PROJECT", "").strip())
@@ -50,12 +62,73 @@ def create_app():
                     if not key_set
                     else "OK for Google AI Studio"
                 ),
+                # Open breakers mean that backend is skipped straight to the next tier / fallback
+                "circuit_breakers": breaker_states(),
             },
         }
 
+    @app.route('/api/stats')
+    def stats():
+        """Process-local counters for the AI hot path (per gunicorn worker)."""
+        from app.routes.glossary import EXPLANATION_STORE
+        from app.services.ai_service import ANALYZE_CACHE, GRADE_CACHE, LLM_SINGLE_FLIGHT
+        from app.services.deadlines import LATENCY
+        from app.services.model_registry import MODEL_REGISTRY
+        from app.services.quiz_pregrader import QUIZ_PREGRADER
+
+        return {
+            "model_registry": MODEL_REGISTRY.stats(),
+            "analyze_cache": ANALYZE_CACHE.stats(),
+            "grade_cache": GRADE_CACHE.stats(),
+            "explanation_store": EXPLANATION_STORE.stats(),
+            "single_flight": LLM_SINGLE_FLIGHT.stats(),
+            # Recent successful call latency per backend (seconds); p95 is the hedging trigger
+            "backend_latency": LATENCY.stats(),
+            # Quiz answers graded locally (no Gemini call) vs sent to the model
+            "quiz_pregrader": QUIZ_PREGRADER.stats(),
+        }
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus scrape target for the AI paths (per gunicorn worker; see app/services/metrics.py)."""
+        from app.routes.glossary import EXPLANATION_STORE
+        from app.services.ai_service import ANALYZE_CACHE, GRADE_CACHE, LLM_SINGLE_FLIGHT
+        from app.services.circuit_breaker import OPEN, breaker_states
+        from app.services.metrics import CONTENT_TYPE, METRICS, cache_samples
+        from app.services.quiz_pregrader import QUIZ_PREGRADER
+
+        extra = []
+        for name, cache in (("analyze", ANALYZE_CACHE), ("grade", GRADE_CACHE)):
+            s = cache.stats()
+            extra += cache_samples(name, s["hits"] + s["disk_hits"], s["misses"], s["entries"])
+        s = EXPLANATION_STORE.stats()
+        extra += cache_samples("explanation", s["hits"] + s["stale_hits"], s["misses"], s["entries_in_memory"])
+        s = LLM_SINGLE_FLIGHT.stats()
+        extra.append(("ai_single_flight_collapsed_total", "counter",
+                      "Identical calls that waited on an in-flight one instead of calling Gemini.", {}, s["collapsed"]))
+        s = QUIZ_PREGRADER.stats()
+        extra.append(("ai_quiz_pregraded_total", "counter",
+                      "Quiz answers graded locally without a model call.", {}, s["llm_calls_saved"]))
+        for backend, state in breaker_states().items():
+            extra.append(("ai_circuit_open", "gauge", "1 while the backend's circuit breaker is open.",
+                          {"backend": backend}, 1 if state["state"] == OPEN else 0))
+            extra.append(("ai_circuit_trips_total", "counter", "Times the backend's circuit breaker opened.",
+                          {"backend": backend}, state["trips"]))
+        return Response(METRICS.render(extra), content_type=CONTENT_TYPE)
+
     return app
 
 
+def create_asgi_app(flask_app=None):
+    """
+    Async serving mode: AI endpoints run as coroutines, everything else goes through the Flask app.
+    Run: uvicorn --factory main:create_asgi_app --port 5001   (needs asgiref + uvicorn)
+    """
+    from app.asgi import AsyncAIApp
+
+    return AsyncAIApp(flask_app or app)
+
+
 app = create_app()
 
 if __name__ == '__main__':
@@ -0,0 +1,212 @@
+"""
+Micro-benchmarks of the request hot paths: ops/sec and memory per call, against a saved baseline.
+
+Covers build_budget_prompt, validate_budget_input and generate_fallback_response on synthetic
+budgets with 7, 50 and 500 expense categories; parse_ai_response on 1, 10 and 50 KB responses;
+_parse_grade_llm_output on short and long grading replies; and glossary search (exact, prefix,
+multi-word and misspelled queries). Each case is timed with timeit (calls per run sized to about
+--min-time, best of --repeat), then run once more under tracemalloc for the peak memory of one
+call and the memory still held after --alloc-calls calls (a growing cache or a leak shows here).
+
+Save a run with --out and pass it to --compare after a change to ai_service.py; the script fails
+when a case loses more than --tolerance of its ops/sec or its peak memory grows by more than that.
+
+Usage (from repo root):
+  cd backend
+  python scripts/bench_hot_paths.py --out bench_baseline.json
+  python scripts/bench_hot_paths.py --compare bench_baseline.json [--filter parse_ai_response]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+_BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_BACKEND_DIR))
+sys.path.insert(0, str(_BACKEND_DIR / "scripts"))
+
+from app.models.budget import BudgetInput, validate_budget_input  # noqa: E402
+from app.routes.glossary import GLOSSARY_INDEX  # noqa: E402
+from app.services.ai_service import (  # noqa: E402
+    _parse_grade_llm_output,
+    build_budget_prompt,
+    generate_fallback_response,
+    parse_ai_response,
+)
+from bench_parse_ai_response import long_output  # noqa: E402
+
+Case = Tuple[str, str, Callable[[], Any]]
+
+BASE_CATEGORIES = ["rent", "food", "transportation", "utilities", "entertainment", "savings", "other"]
+CATEGORY_COUNTS = (7, 50, 500)
+RESPONSE_KB = (1, 10, 50)
+GLOSSARY_QUERIES = {
+    "exact": "etf",
+    "prefix": "comp",
+    "multi_word": "emergency fund savings account",
+    "misspelled": "bugdet",
+}
+
+
+def synthetic_budget(categories: int, seed: int = 7) -> Dict[str, Any]:
+    """Request payload with `categories` expenses totalling about 85% of income."""
+    rng = random.Random(seed + categories)
+    names = BASE_CATEGORIES[:categories] + [f"category_{i:03d}" for i in range(len(BASE_CATEGORIES), categories)]
+    income = 6000.0
+    weights = [rng.uniform(0.5, 2.0) for _ in names]
+    scale = income * 0.85 / sum(weights)
+    return {
+        "monthly_income": income,
+        "expenses": {name: round(w * scale, 2) for name, w in zip(names, weights)},
+        "goal": "emergency_fund",
+    }
+
+
+def sized_response(kb: int) -> str:
+    """A well-formed analysis response padded with advice text to about `kb` kilobytes."""
+    base = len(long_output(0).encode("utf-8"))
+    filler = len("Consider your budget carefully. ")
+    return long_output(max(0, (kb * 1024 - base) // filler))
+
+
+def grade_reply(feedback_sentences: int) -> str:
+    sentence = "You used the income figure, but show how the 30% guideline compares with rent. "
+    return "VERDICT: Partially  Correct\nFEEDBACK: " + sentence * feedback_sentences
+
+
+def cases() -> List[Case]:
+    out: List[Case] = []
+    for n in CATEGORY_COUNTS:
+        data = synthetic_budget(n)
+        budget = BudgetInput(data["monthly_income"], data["expenses"], data["goal"])
+        out.append(("validate_budget_input", f"{n} categories", lambda d=data: validate_budget_input(d)))
+        out.append(("build_budget_prompt", f"{n} categories", lambda b=budget: build_budget_prompt(b)))
+        out.append(("generate_fallback_response", f"{n} categories", lambda b=budget: generate_fallback_response(b)))
+
+    budget = BudgetInput(9000.0, {"rent": 2700, "food": 900, "savings": 900, "other": 300}, "general")
+    for kb in RESPONSE_KB:
+        text = sized_response(kb)
+        out.append(("parse_ai_response", f"{kb} KB", lambda t=text: parse_ai_response(t, budget)))
+
+    for label, sentences in (("short", 2), ("10 KB", 125)):
+        text = grade_reply(sentences)
+        out.append(("_parse_grade_llm_output", label, lambda t=text: _parse_grade_llm_output(t)))
+
+    for label, query in GLOSSARY_QUERIES.items():
+        out.append(("glossary_search", label, lambda q=query: GLOSSARY_INDEX.search(q, limit=20)))
+    return out
+
+
+def time_case(fn: Callable[[], Any], min_time: float, repeat: int) -> Tuple[float, int]:
+    """(best seconds per call, calls per run)."""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number, number
+
+
+def memory_case(fn: Callable[[], Any], calls: int) -> Tuple[int, int]:
+    """(peak bytes during one call, bytes still allocated per call after `calls` calls)."""
+    fn()  # first-call caches (compiled regexes, lazy imports) are not per-call costs
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1] - base
+        del result
+        base = tracemalloc.get_traced_memory()[0]
+        for _ in range(calls):
+            fn()
+        retained = (tracemalloc.get_traced_memory()[0] - base) // calls
+    finally:
+        tracemalloc.stop()
+    return peak, max(0, retained)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """Print changes per case; return the regressions."""
+    regressions = []
+    before = baseline.get("results", {})
+    print(f"\nAgainst baseline from {baseline.get('meta', {}).get('created', '?')} (tolerance {tolerance:.0%}):")
+    for key, now in current["results"].items():
+        old = before.get(key)
+        if old is None:
+            continue
+        speed = now["ops_per_sec"] / old["ops_per_sec"] - 1 if old["ops_per_sec"] else 0.0
+        memory = (now["peak_bytes"] - old["peak_bytes"]) / old["peak_bytes"] if old["peak_bytes"] else 0.0
+        flag = ""
+        if speed < -tolerance:
+            regressions.append(f"{key}: ops/sec {speed:+.0%}")
+            flag = "  <-- slower"
+        if memory > tolerance and now["peak_bytes"] - old["peak_bytes"] > 1024:
+            regressions.append(f"{key}: peak memory {memory:+.0%}")
+            flag += "  <-- more memory"
+        print(f"  {key:<52} ops/sec {speed:+7.1%}   peak {memory:+7.1%}{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--filter", default="", help="only cases whose name contains this text")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per case (best is kept)")
+    parser.add_argument("--alloc-calls", type=int, default=50, help="calls traced for retained memory")
+    parser.add_argument("--out", type=Path, default=None, help="write results JSON here")
+    parser.add_argument("--compare", type=Path, default=None, help="baseline results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed ops/sec loss or peak memory growth")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    print(f"{'case':<30}{'input':<16}{'ops/sec':>12}{'µs/op':>11}{'peak KB':>10}{'retained B/op':>15}")
+    for name, label, fn in cases():
+        if args.filter not in name:
+            continue
+        per_call, number = time_case(fn, args.min_time, args.repeat)
+        peak, retained = memory_case(fn, args.alloc_calls)
+        results[f"{name} [{label}]"] = {
+            "ops_per_sec": round(1 / per_call, 1),
+            "us_per_op": round(per_call * 1e6, 3),
+            "calls_per_run": number,
+            "peak_bytes": peak,
+            "retained_bytes_per_call": retained,
+        }
+        print(f"{name:<30}{label:<16}{1 / per_call:>12,.0f}{per_call * 1e6:>11.2f}{peak / 1024:>10.1f}{retained:>15,}")
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "min_time": args.min_time,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.out is not None:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Wrote {args.out}")
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        if regressions:
+            print("REGRESSIONS:\n  " + "\n  ".join(regressions))
+            return 1
+        print("No regressions beyond tolerance.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
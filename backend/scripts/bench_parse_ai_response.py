@@ -0,0 +1,130 @@
+"""
+Micro-benchmark: section parsing of a long Gemini response, one-pass tokenizer vs per-section regex.
+
+`parse_ai_response` used to run one freshly formatted `re.search` per section (seven scans of the
+response, plus a second "SAVING PLAN" lookup) and re-compile the bullet regex on every line. It
+now tokenizes the response once (`_section_bodies`). This script times both on the long output
+from `test_parse_ai_response_long_output` (and a larger variant), and checks they agree.
+
+Usage (from repo root):
+  cd backend
+  python scripts/bench_parse_ai_response.py [--repeat 2000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.models.budget import BudgetInput  # noqa: E402
+from app.services.ai_service import (  # noqa: E402
+    AI_SECTIONS,
+    _bullet_lines,
+    _parse_saving_plan,
+    _section_bodies,
+    parse_ai_response,
+)
+
+
+def long_output(filler_repeats: int = 400) -> str:
+    """Same shape as the response in test_tutor.test_parse_ai_response_long_output."""
+    filler = "Consider your budget carefully. " * filler_repeats
+    return f"""## FINANCIAL ADVICE
+{filler}
+Your income is $9000.00 and savings line is $900.00 per month.
+
+## QUIZ QUESTION
+Given income $9000.00, what fraction of income is the $900.00 savings line?
+
+## QUIZ ANSWER KEY
+Strong answers compute 900 / 9000 = 10% and compare to Savings Benchmarks in financial_rules.md.
+
+## GROUNDED TIP
+Per Savings Benchmarks (financial_rules.md), your $900.00 savings on $9000.00 income is worth improving toward 15–20%.
+
+## SAVING TIPS
+- Move $50 from entertainment toward savings ($900.00 baseline).
+- Review subscriptions using your $9000.00 income as the anchor.
+
+## SAVING PLAN (3-6 MONTHS)
+Months 1-3:
+- Track spending against $9000.00 income
+- Add $25/week to savings from the $900.00 line
+
+Months 4-6:
+- Aim to grow savings toward 15% of $9000.00
+
+## WHERE SAVINGS COULD GO
+High-yield savings and retirement accounts in general terms. Talk to a licensed financial advisor for your situation.
+
+Disclaimer: This is for education only and is not financial advice.
+"""
+
+
+# --- Previous implementation, kept here only as the baseline ---
+
+def legacy_find_section(text: str, name: str) -> str:
+    pattern = rf"##\s*{re.escape(name)}\s*\n(.*?)(?=\n##\s|\nDisclaimer:|$)"
+    m = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
+    return m.group(1).strip() if m else ""
+
+
+def legacy_bullet_lines(text: str) -> list:
+    lines = []
+    for line in text.split("\n"):
+        line = re.sub(r"^[\s\-*•]+\s*", "", line).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+
+def legacy_sections(text: str) -> dict:
+    out = {}
+    for header in ("FINANCIAL ADVICE", "QUIZ QUESTION", "QUIZ ANSWER KEY", "GROUNDED TIP", "WHERE SAVINGS COULD GO"):
+        out[header] = legacy_find_section(text, header)
+    out["SAVING TIPS"] = legacy_bullet_lines(legacy_find_section(text, "SAVING TIPS"))
+    plan_raw = legacy_find_section(text, "SAVING PLAN (3-6 MONTHS)") or legacy_find_section(text, "SAVING PLAN")
+    plan = {}
+    if plan_raw:
+        m13 = re.search(r"Months?\s*1-3[:\-]?\s*(.*?)(?=Months?\s*4-6|$)", plan_raw, re.IGNORECASE | re.DOTALL)
+        m46 = re.search(r"Months?\s*4-6[:\-]?\s*(.*?)$", plan_raw, re.IGNORECASE | re.DOTALL)
+        if m13:
+            plan["months_1_3"] = legacy_bullet_lines(m13.group(1).strip())
+        if m46:
+            plan["months_4_6"] = legacy_bullet_lines(m46.group(1).strip())
+    out["SAVING PLAN"] = plan
+    return out
+
+
+def onepass_sections(text: str) -> dict:
+    bodies = _section_bodies(text)
+    out = {h: bodies.get(h, "") for h in ("FINANCIAL ADVICE", "QUIZ QUESTION", "QUIZ ANSWER KEY", "GROUNDED TIP", "WHERE SAVINGS COULD GO")}
+    out["SAVING TIPS"] = _bullet_lines(bodies.get("SAVING TIPS", ""))
+    out["SAVING PLAN"] = _parse_saving_plan(bodies.get("SAVING PLAN (3-6 MONTHS)") or bodies.get("SAVING PLAN", ""))
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=2000, help="parses per timing run")
+    args = parser.parse_args()
+
+    budget = BudgetInput(9000.0, {"rent": 2700, "food": 900, "savings": 900, "other": 300}, "general")
+    print(f"{len(AI_SECTIONS)} known headers; {args.repeat} parses per run, best of 5\n")
+    print(f"{'response':<18}{'legacy µs':>12}{'one-pass µs':>14}{'speedup':>10}{'parse_ai_response µs':>24}")
+    for label, repeats in (("long (~13 KB)", 400), ("very long (~50 KB)", 1600)):
+        text = long_output(repeats)
+        assert legacy_sections(text) == onepass_sections(text), "one-pass tokenizer disagrees with legacy parse"
+        legacy = min(timeit.repeat(lambda: legacy_sections(text), number=args.repeat, repeat=5)) / args.repeat
+        onepass = min(timeit.repeat(lambda: onepass_sections(text), number=args.repeat, repeat=5)) / args.repeat
+        full = min(timeit.repeat(lambda: parse_ai_response(text, budget), number=args.repeat, repeat=5)) / args.repeat
+        print(f"{label:<18}{legacy * 1e6:>12.1f}{onepass * 1e6:>14.1f}{legacy / onepass:>9.1f}x{full * 1e6:>24.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Startup benchmark: time and memory for a worker to import the app and answer /api/health.
+
+Each run is a fresh interpreter (like a new gunicorn worker), so nothing is cached between runs.
+"lazy" is the normal startup, where the Gemini SDKs load on the first AI call. "eager" also imports
+every installed SDK before the first request, the way ai_service used to at import time (and
+what AI_SDK_PREWARM=1 does in the background). Without google-generativeai /
+google-cloud-aiplatform installed the two modes match.
+
+Usage (from repo root):
+  cd backend
+  python scripts/bench_startup.py [--runs 10]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+_BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+_CHILD = r"""
+import json, resource, sys, time
+t0 = time.perf_counter()
+import main
+from app.services import ai_service
+if sys.argv[1] == "eager":
+    ai_service._load_genai()
+    ai_service._load_vertex()
+t1 = time.perf_counter()
+status = main.app.test_client().get("/api/health").status_code
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_s": t1 - t0,
+    "first_health_s": t2 - t0,
+    "status": status,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+    "sdks_loaded": [m for m in ("google.generativeai", "vertexai") if m in sys.modules],
+}))
+"""
+
+
+def run_once(mode: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD, mode],
+        cwd=_BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # The app may print during import; the measurement is the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10, help="fresh interpreters per mode")
+    args = parser.parse_args()
+
+    print(f"{args.runs} fresh interpreters per mode, median (min)\n")
+    print(f"{'mode':<8}{'import ms':>18}{'first /api/health ms':>24}{'max RSS MB':>13}{'modules':>10}  SDKs loaded")
+    for mode in ("lazy", "eager"):
+        runs = [run_once(mode) for _ in range(max(1, args.runs))]
+        imp = [r["import_s"] * 1000 for r in runs]
+        health = [r["first_health_s"] * 1000 for r in runs]
+        rss = statistics.median(r["max_rss_mb"] for r in runs)
+        last = runs[-1]
+        print(
+            f"{mode:<8}{statistics.median(imp):>10.1f} ({min(imp):>5.1f})"
+            f"{statistics.median(health):>16.1f} ({min(health):>5.1f})"
+            f"{rss:>13.1f}{last['modules']:>10}  {', '.join(last['sdks_loaded']) or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
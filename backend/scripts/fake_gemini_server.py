@@ -0,0 +1,295 @@
+"""
+Local stand-in for the Gemini REST API, for load tests that must not spend quota.
+
+Answers `POST /v1beta/models/<model>:generateContent` (and `:streamGenerateContent`) after a
+configurable delay, with a configurable share of errors. The body depends on which prompt came in:
+budget analyses (markdown sections, or JSON when the request asks for it) are rendered from the
+scenarios in scripts/sprint3_capture_ai_column.py; quiz grades, packed batch grades, chat
+replies and glossary explanations have fixed shapes. `--responses` replaces any of them with
+texts from a JSON file: {"analyze": [...], "grade": [...], "chat": [...], "explain": [...]}.
+
+Point the backend at it (needs google-generativeai; calls go over REST):
+  GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://127.0.0.1:8089 python main.py
+
+Usage (from repo root):
+  cd backend
+  python scripts/fake_gemini_server.py [--port 8089] [--latency-ms 800] [--jitter 0.3] [--error-rate 0.02]
+
+GET /stats on the server returns request counts per prompt kind. scripts/load_test.py starts
+one automatically.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+_SCRIPTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(_SCRIPTS_DIR.parent))
+sys.path.insert(0, str(_SCRIPTS_DIR))
+
+_PATH_RE = re.compile(r"^/v1(?:beta)?/models/([^/:]+):(generateContent|streamGenerateContent)$")
+_ANSWER_RE = re.compile(r"^\[\[ANSWER (\d+) \w+\]\]$", re.MULTILINE)
+
+ERRORS = {
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+}
+
+
+def scenario_fields() -> List[Dict[str, Any]]:
+    """Analysis fields for each sprint 3 scenario, written by the deterministic analyzer."""
+    from app.services.ai_service import generate_fallback_response
+    from sprint3_capture_ai_column import scenarios
+
+    return [generate_fallback_response(budget) for _title, budget in scenarios()]
+
+
+def default_responses() -> Dict[str, List[str]]:
+    from app.services.ai_service import _analysis_markdown
+
+    fields = scenario_fields()
+    return {
+        "analyze": [_analysis_markdown(f) for f in fields],
+        "analyze_json": [json.dumps(f) for f in fields],
+        "grade": [
+            "VERDICT: PARTIALLY CORRECT\nFEEDBACK: You found the right rule but left out the dollar amount. "
+            "Show the calculation step so the number is clear.",
+            "VERDICT: CORRECT\nFEEDBACK: Nice work: you used the income figure and the percentage correctly.",
+            "VERDICT: INCORRECT\nFEEDBACK: The answer does not use the numbers from the question. "
+            "Start from the monthly income and apply the percentage.",
+        ],
+        "chat": [
+            "Start by tracking what you spend on food for two weeks. Plan meals around what you already have, "
+            "shop with a list, and set a weekly grocery cap. Cooking in batches cuts takeout. "
+            "Move whatever you save to savings on payday.",
+        ],
+        "explain": [
+            "An ETF is a basket of investments you can buy and sell like a single stock. It lets you own a "
+            "small piece of many companies at once.\n\nFor example, one share of an index ETF can spread "
+            "$100 across hundreds of companies instead of just one.",
+        ],
+    }
+
+
+def prompt_kind(prompt: str, wants_json: bool) -> str:
+    if "VERDICT:" in prompt:
+        return "grade_batch" if "Student answers:" in prompt else "grade"
+    if "FINANCIAL ADVICE" in prompt or "financial_advice" in prompt:
+        return "analyze_json" if wants_json else "analyze"
+    if "financial term" in prompt:
+        return "explain"
+    return "chat"
+
+
+class FakeGemini:
+    """The fake's behaviour and counters; shared by every handler thread."""
+
+    def __init__(
+        self,
+        latency_ms: float = 800.0,
+        jitter: float = 0.3,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        responses: Optional[Dict[str, List[str]]] = None,
+        seed: int = 7,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.responses = default_responses()
+        self.responses.update(responses or {})
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._cycles = {kind: itertools.cycle(texts) for kind, texts in self.responses.items()}
+        self.counts: Dict[str, int] = {}
+        self.errors = 0
+
+    def delay(self) -> float:
+        """Seconds to wait: log-normal around latency_ms, so there is a tail like the real API."""
+        with self._lock:
+            factor = self._random.lognormvariate(0.0, self.jitter) if self.jitter > 0 else 1.0
+            return self.latency_ms * factor / 1000.0
+
+    def fail(self) -> bool:
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+    def answer(self, prompt: str, wants_json: bool) -> str:
+        kind = prompt_kind(prompt, wants_json)
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            if kind != "grade_batch":
+                return next(self._cycles[kind])
+            blocks = [f"ANSWER {n}\n{next(self._cycles['grade'])}" for n in _ANSWER_RE.findall(prompt)]
+        return "\n\n".join(blocks)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"requests": dict(self.counts), "errors": self.errors}
+
+
+def _candidate(text: str, finish: Optional[str] = "STOP") -> Dict[str, Any]:
+    candidate: Dict[str, Any] = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finish:
+        candidate["finishReason"] = finish
+    return candidate
+
+
+def _usage(prompt: str, text: str) -> Dict[str, int]:
+    # About four characters per token, close enough for cost estimates
+    prompt_tokens, completion_tokens = math.ceil(len(prompt) / 4), math.ceil(len(text) / 4)
+    return {
+        "promptTokenCount": prompt_tokens,
+        "candidatesTokenCount": completion_tokens,
+        "totalTokenCount": prompt_tokens + completion_tokens,
+    }
+
+
+def make_handler(fake: FakeGemini):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # noqa: A002 - BaseHTTPRequestHandler's signature
+            pass
+
+        def _send(self, status: int, payload: Any) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                self._send(200, fake.stats())
+            else:
+                self._send(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+
+        def do_POST(self):
+            match = _PATH_RE.match(self.path.split("?", 1)[0])
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                request = None
+            if match is None or not isinstance(request, dict):
+                self._send(400, {"error": {"code": 400, "message": "bad request", "status": "INVALID_ARGUMENT"}})
+                return
+
+            prompt = "\n".join(
+                part.get("text", "")
+                for content in request.get("contents", [])
+                for part in content.get("parts", [])
+            )
+            config = request.get("generationConfig") or request.get("generation_config") or {}
+            wants_json = "json" in str(config.get("responseMimeType") or config.get("response_mime_type") or "")
+            time.sleep(fake.delay())
+            if fake.fail():
+                status = fake.error_status
+                self._send(status, {"error": {"code": status, "message": "fake upstream error",
+                                              "status": ERRORS.get(status, "INTERNAL")}})
+                return
+
+            text = fake.answer(prompt, wants_json)
+            if match.group(2) == "generateContent":
+                self._send(200, {"candidates": [_candidate(text)], "usageMetadata": _usage(prompt, text)})
+                return
+            # REST streaming answers a JSON array of partial responses
+            third = max(1, len(text) // 3)
+            pieces = [text[i:i + third] for i in range(0, len(text), third)]
+            chunks = [{"candidates": [_candidate(p, None)]} for p in pieces[:-1]]
+            chunks.append({"candidates": [_candidate(pieces[-1])], "usageMetadata": _usage(prompt, text)})
+            self._send(200, chunks)
+
+    return Handler
+
+
+class FakeGeminiServer:
+    """The fake on a background thread: `server = FakeGeminiServer(FakeGemini()).start(); server.url`."""
+
+    def __init__(self, fake: FakeGemini, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.fake = fake
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(fake))
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGeminiServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-gemini", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def load_responses(path: Optional[Path]) -> Dict[str, List[str]]:
+    if path is None:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {kind: [texts] if isinstance(texts, str) else list(texts) for kind, texts in data.items()}
+
+
+def add_fake_arguments(parser: argparse.ArgumentParser) -> None:
+    """Options shared with scripts/load_test.py."""
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="median upstream latency")
+    parser.add_argument("--jitter", type=float, default=0.3, help="log-normal sigma of the latency (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls that fail")
+    parser.add_argument("--error-status", type=int, default=500, choices=sorted(ERRORS), help="HTTP status of failures")
+    parser.add_argument("--responses", type=Path, default=None, help="JSON file of response texts per prompt kind")
+    parser.add_argument("--seed", type=int, default=7, help="random seed for latency and errors")
+
+
+def fake_from_args(args: argparse.Namespace) -> FakeGemini:
+    return FakeGemini(
+        latency_ms=args.latency_ms,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        responses=load_responses(args.responses),
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(fake_from_args(args), args.host, args.port)
+    print(f"Fake Gemini API on {server.url} (latency {args.latency_ms:g} ms, jitter {args.jitter:g}, "
+          f"errors {args.error_rate:.0%} -> HTTP {args.error_status}); Ctrl+C to stop")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
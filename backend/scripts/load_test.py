@@ -0,0 +1,302 @@
+"""
+Load test of the AI endpoints against a local fake Gemini API (no quota spent).
+
+Starts scripts/fake_gemini_server.py and the backend (`python main.py`, pointed at the fake via
+GEMINI_API_ENDPOINT). It then drives /api/analyze, /api/grade-quiz, /api/chat and
+/api/glossary/explain at each concurrency level. It reports throughput, p50/p95/p99 latency,
+errors and the answer source mix, where the endpoint returns one (a rising fallback share
+usually means deadlines are firing). Analyze payloads are the scenarios from
+scripts/sprint3_capture_ai_column.py.
+
+By default every request is unique, so caches miss and each one reaches the fake. --warm
+repeats identical payloads to measure the cached path instead. With --url the backend is not
+started and an already running server (gunicorn, uvicorn, ...) is tested instead.
+
+Results are written as JSON (--out) and can be compared with an earlier run (--compare): the run
+fails when p95/p99 latency grows, or throughput drops, by more than --tolerance.
+
+Needs google-generativeai in the backend's environment; without it every answer is the
+deterministic fallback and the report says so.
+
+Usage (from repo root):
+  cd backend
+  python scripts/load_test.py --concurrency 1 8 32 --requests 200 --out load_baseline.json
+  python scripts/load_test.py --compare load_baseline.json --out load_latest.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_BACKEND_DIR))
+sys.path.insert(0, str(_BACKEND_DIR / "scripts"))
+
+from fake_gemini_server import FakeGeminiServer, add_fake_arguments, fake_from_args  # noqa: E402
+from sprint3_capture_ai_column import scenarios  # noqa: E402
+
+ENDPOINTS = {
+    "analyze": "/api/analyze",
+    "grade": "/api/grade-quiz",
+    "chat": "/api/chat",
+    "explain": "/api/glossary/explain",
+}
+
+QUIZ_QUESTION = "Your income is $4000 and rent is $1800. What share of income goes to rent, and is that above the 30% guideline?"
+QUIZ_KEY = "1800 / 4000 = 45%, which is above the 30% housing guideline."
+# Answers the local pre-grader cannot settle, so they reach the model
+QUIZ_ANSWERS = [
+    "It is a big part of the income, probably too much compared with the usual guideline.",
+    "Rent takes close to half of what they earn, which seems high for housing.",
+    "They should look at whether housing fits the rule of thumb for their budget.",
+]
+
+
+def _tag(i: int) -> str:
+    """A letters-only suffix unique per request (digits would change what the pre-grader sees)."""
+    letters = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        letters = chr(ord("a") + r) + letters
+    return letters
+
+
+def payload_makers(warm: bool) -> Dict[str, Callable[[int], Dict[str, Any]]]:
+    budgets = [
+        {"monthly_income": b.monthly_income, "expenses": dict(b.expenses), "goal": b.goal}
+        for _title, b in scenarios()
+    ]
+
+    def analyze(i: int) -> Dict[str, Any]:
+        body = dict(budgets[i % len(budgets)])
+        if not warm:
+            # A cent of income per request is enough for a new cache key
+            body["monthly_income"] = round(body["monthly_income"] + i / 100, 2)
+        return body
+
+    def grade(i: int) -> Dict[str, Any]:
+        answer = QUIZ_ANSWERS[i % len(QUIZ_ANSWERS)]
+        if not warm:
+            answer += f" ref {_tag(i)}"
+        return {"quiz_question": QUIZ_QUESTION, "quiz_answer_key": QUIZ_KEY, "user_answer": answer}
+
+    def chat(i: int) -> Dict[str, Any]:
+        message = "How can I cut my food spending?" + ("" if warm else f" ref {_tag(i)}")
+        return {"message": message, "context": {"monthly_income": 4000, "goal": "emergency_fund"}}
+
+    def explain(i: int) -> Dict[str, Any]:
+        body = {"term": ("ETF", "Bond", "Index Fund", "Compound Interest")[i % 4], "complexity": "beginner"}
+        if not warm:
+            # Custom questions skip the explanation store
+            body["custom_prompt"] = f"How would a student use this? ref {_tag(i)}"
+        return body
+
+    return {"analyze": analyze, "grade": grade, "chat": chat, "explain": explain}
+
+
+def post(url: str, body: Dict[str, Any], timeout: float) -> Tuple[int, Optional[Dict[str, Any]], float]:
+    data = json.dumps(body).encode("utf-8")
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="POST")
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            raw, status = response.read(), response.status
+    except urllib.error.HTTPError as e:
+        raw, status = e.read(), e.code
+    except (urllib.error.URLError, OSError):
+        return 0, None, time.perf_counter() - started
+    elapsed = time.perf_counter() - started
+    try:
+        return status, json.loads(raw), elapsed
+    except ValueError:
+        return status, None, elapsed
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def run_level(base_url: str, endpoint: str, make: Callable[[int], Dict[str, Any]], concurrency: int,
+              requests: int, offset: int, timeout: float) -> Dict[str, Any]:
+    url = base_url + ENDPOINTS[endpoint]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(lambda i: post(url, make(offset + i), timeout), range(requests)))
+    wall = time.perf_counter() - started
+
+    latencies = [elapsed * 1000 for _status, _body, elapsed in outcomes]
+    sources: Dict[str, int] = {}
+    errors = 0
+    for status, body, _elapsed in outcomes:
+        if status != 200:
+            errors += 1
+            source = f"http_{status}" if status else "no_response"
+        elif body is not None and "output_source" in body:
+            source = "cache" if body.get("cache_hit") else body["output_source"]
+        else:
+            continue
+        sources[source] = sources.get(source, 0) + 1
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / wall, 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+        "sources": dict(sorted(sources.items())),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_backend(fake_url: str) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        HOST="127.0.0.1",
+        FLASK_DEBUG="False",
+        GEMINI_API_KEY="fake-load-test-key",
+        GEMINI_API_ENDPOINT=fake_url,
+        GOOGLE_CLOUD_PROJECT="",
+        # Keep the run self-contained: no SQLite tiers, no trace file
+        ANALYZE_CACHE_DB="",
+        GRADE_CACHE_DB="",
+        EXPLAIN_STORE_DB="",
+        TRACE_SAMPLE_RATE="0",
+    )
+    process = subprocess.Popen([sys.executable, "main.py"], cwd=_BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def wait_healthy(base_url: str, seconds: float = 30.0) -> Dict[str, Any]:
+    deadline = time.monotonic() + seconds
+    while True:
+        try:
+            with urllib.request.urlopen(base_url + "/api/health", timeout=2) as response:
+                return json.loads(response.read())
+        except (urllib.error.URLError, OSError):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"backend at {base_url} did not become healthy in {seconds:g}s")
+            time.sleep(0.2)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """Print deltas per endpoint and concurrency; return the regressions."""
+    regressions = []
+    print(f"\nAgainst baseline from {baseline.get('meta', {}).get('created', '?')} (tolerance {tolerance:.0%}):")
+    for endpoint, levels in current["results"].items():
+        for level, now in levels.items():
+            before = baseline.get("results", {}).get(endpoint, {}).get(level)
+            if before is None:
+                continue
+            cells = []
+            for key, worse_if_higher in (("p50_ms", True), ("p95_ms", True), ("p99_ms", True), ("rps", False)):
+                change = (now[key] - before[key]) / before[key] if before[key] else 0.0
+                cells.append(f"{key} {before[key]:g}->{now[key]:g} ({change:+.0%})")
+                if key != "p50_ms" and (change > tolerance if worse_if_higher else change < -tolerance):
+                    regressions.append(f"{endpoint} @ {level}: {key} {change:+.0%}")
+            print(f"  {endpoint:<8} c={level:<4} " + "  ".join(cells))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32], help="concurrent clients per level")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint and level")
+    parser.add_argument("--timeout", type=float, default=30.0, help="client timeout per request (seconds)")
+    parser.add_argument("--warm", action="store_true", help="repeat identical payloads (measures the cached path)")
+    parser.add_argument("--url", default="", help="test an already running backend instead of starting one")
+    parser.add_argument("--out", type=Path, default=None, help="write results JSON here")
+    parser.add_argument("--compare", type=Path, default=None, help="baseline results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95/p99/throughput change vs baseline")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    fake = fake_from_args(args)
+    server = FakeGeminiServer(fake).start()
+    backend = None
+    base_url = args.url.rstrip("/")
+    if not base_url:
+        backend, base_url = start_backend(server.url)
+    try:
+        health = wait_healthy(base_url)
+        sdk = health.get("ai", {}).get("google_generativeai_installed", False)
+        print(f"Backend {base_url} -> fake Gemini {server.url} (latency {args.latency_ms:g} ms, "
+              f"jitter {args.jitter:g}, errors {args.error_rate:.0%}), {'warm' if args.warm else 'cold'} payloads")
+        if not sdk:
+            print("WARNING: google-generativeai is not installed in the backend's environment; every answer is the "
+                  "deterministic fallback and the fake is never called.")
+
+        makers = payload_makers(args.warm)
+        results: Dict[str, Dict[str, Any]] = {}
+        print(f"\n{'endpoint':<9}{'conc':>5}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}  sources")
+        offset = 0
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                row = run_level(base_url, endpoint, makers[endpoint], concurrency, args.requests, offset, args.timeout)
+                offset += args.requests
+                results.setdefault(endpoint, {})[str(concurrency)] = row
+                sources = ", ".join(f"{k} {v}" for k, v in row["sources"].items()) or "-"
+                print(f"{endpoint:<9}{concurrency:>5}{row['rps']:>9.1f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+                      f"{row['p99_ms']:>10.1f}{row['errors']:>8}  {sources}")
+        print(f"\nFake Gemini saw: {fake.stats()}")
+    finally:
+        if backend is not None:
+            backend.terminate()
+            backend.wait(timeout=10)
+        server.stop()
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sdk_installed": sdk,
+            "warm": args.warm,
+            "requests_per_level": args.requests,
+            "fake": {"latency_ms": args.latency_ms, "jitter": args.jitter, "error_rate": args.error_rate,
+                     "error_status": args.error_status, "seed": args.seed},
+        },
+        "results": results,
+    }
+    if args.out is not None:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Wrote {args.out}")
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        if regressions:
+            print("REGRESSIONS:\n  " + "\n  ".join(regressions))
+            return 1
+        print("No regressions beyond tolerance.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Fill the glossary explanation store offline: every term at every complexity level.
+
+Run before a demo or after bumping EXPLAIN_PROMPT_VERSION, so the first learner to click
+"Explain" gets a stored answer instead of waiting for Gemini. Entries that are already stored
+and fresh are skipped unless --force is given. Uses the same prompt, model and store
+(EXPLAIN_STORE_DB) as POST /api/glossary/explain.
+
+Usage (from repo root):
+  cd backend
+  python scripts/prewarm_explanations.py [--workers 4] [--force] [--complexity beginner advanced]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+_BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(_BACKEND_DIR / ".env")
+
+from app.routes.glossary import (  # noqa: E402
+    EXPLANATION_STORE,
+    GLOSSARY_TERMS,
+    _explain_request,
+    generate_explanation,
+)
+from app.services.ai_service import GENAI_STUDIO_AVAILABLE  # noqa: E402
+
+COMPLEXITIES = ("beginner", "intermediate", "advanced")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4, help="concurrent Gemini calls")
+    parser.add_argument("--force", action="store_true", help="regenerate entries that are still fresh")
+    parser.add_argument("--complexity", nargs="+", choices=COMPLEXITIES, default=list(COMPLEXITIES))
+    args = parser.parse_args()
+
+    if not GENAI_STUDIO_AVAILABLE:
+        print("google-generativeai is not installed (pip install -r requirements.txt)")
+        return 1
+
+    jobs = []
+    skipped = 0
+    for glossary_term in GLOSSARY_TERMS:
+        for complexity in args.complexity:
+            (term, complexity, _custom, _entry, prompt), _error = _explain_request(
+                {"term": glossary_term["term"], "complexity": complexity}
+            )
+            stored = EXPLANATION_STORE.get(term, complexity)
+            if stored is not None and not stored[1] and not args.force:
+                skipped += 1
+                continue
+            jobs.append((term, complexity, prompt))
+
+    print(f"{len(jobs)} explanations to generate, {skipped} already fresh "
+          f"({len(GLOSSARY_TERMS)} terms x {len(args.complexity)} levels)")
+    t0 = time.perf_counter()
+    written = failed = 0
+
+    def run(term: str, complexity: str, prompt: str) -> None:
+        text = generate_explanation(prompt)
+        if not text:
+            raise ValueError("empty response")
+        EXPLANATION_STORE.put(term, complexity, text)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(run, *job): job for job in jobs}
+        for future in as_completed(futures):
+            term, complexity, _prompt = futures[future]
+            try:
+                future.result()
+                written += 1
+            except Exception as e:
+                failed += 1
+                print(f"  failed: {term} ({complexity}): {type(e).__name__}: {e}")
+
+    print(f"Stored {written}, failed {failed} in {time.perf_counter() - t0:.1f}s -> "
+          f"{EXPLANATION_STORE.db_path or 'memory only (EXPLAIN_STORE_DB is empty)'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
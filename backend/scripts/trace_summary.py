@@ -0,0 +1,138 @@
+"""
+Summarize sampled request traces (TRACE_FILE, default backend/traces.jsonl) by stage.
+
+Each line of the file is one request written by app/services/tracing.py. Stages are shown as a
+tree, the way a flame graph stacks them: calls, mean / p50 / p95 duration and share of all traced
+time, with "(self)" for time inside a stage (or the request) that no child span covers. --folded
+prints folded stacks (self time in microseconds) for flamegraph.pl or speedscope instead.
+
+Usage (from repo root):
+  cd backend
+  python scripts/trace_summary.py [--file traces.jsonl] [--name analyze] [--by output_source]
+  python scripts/trace_summary.py --folded > analyze.folded
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.tracing import trace_file  # noqa: E402
+
+Stack = Tuple[str, ...]
+
+BAR_WIDTH = 30
+
+
+def read_traces(path: Path, name: str = "") -> List[dict]:
+    traces = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                trace = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash mid-write
+            if not name or trace.get("name") == name:
+                traces.append(trace)
+    return traces
+
+
+def stacks(trace: dict) -> Iterable[Tuple[Stack, float, float]]:
+    """(stack, duration ms, self ms) per span, plus the request itself as the root."""
+    root = trace["name"]
+    path: List[str] = []
+    child_time: Dict[Stack, float] = defaultdict(float)
+    rows = []
+    for s in sorted(trace["spans"], key=lambda s: (s["start_ms"], s["depth"])):
+        path = path[:s["depth"]] + [s["name"]]
+        stack = (root, *path)
+        child_time[stack[:-1]] += s["dur_ms"]
+        rows.append((stack, s["dur_ms"]))
+    yield (root,), trace["total_ms"], max(0.0, trace["total_ms"] - child_time[(root,)])
+    for stack, dur in rows:
+        yield stack, dur, max(0.0, dur - child_time[stack])
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(traces: List[dict]) -> None:
+    durations: Dict[Stack, List[float]] = defaultdict(list)
+    self_time: Dict[Stack, float] = defaultdict(float)
+    for trace in traces:
+        for stack, dur, own in stacks(trace):
+            durations[stack].append(dur)
+            self_time[stack] += own
+    grand_total = sum(sum(v) for k, v in durations.items() if len(k) == 1) or 1.0
+
+    print(f"{'stage':<32}{'calls':>7}{'mean ms':>11}{'p50 ms':>10}{'p95 ms':>10}{'share':>8}")
+    for stack in sorted(durations, key=lambda k: [(-sum(durations[k[:i]]), k[i - 1]) for i in range(1, len(k) + 1)]):
+        values = durations[stack]
+        label = "  " * (len(stack) - 1) + stack[-1]
+        share = sum(values) / grand_total
+        print(
+            f"{label:<32}{len(values):>7}{sum(values) / len(values):>11.2f}{percentile(values, 50):>10.2f}"
+            f"{percentile(values, 95):>10.2f}{share:>7.1%}  {'#' * round(share * BAR_WIDTH)}"
+        )
+        children = [k for k in durations if len(k) == len(stack) + 1 and k[:-1] == stack]
+        if children and self_time[stack] > 0:
+            own = self_time[stack] / grand_total
+            label = "  " * len(stack) + "(self)"
+            print(f"{label:<32}{'':>7}{self_time[stack] / len(values):>11.2f}{'':>20}{own:>7.1%}  {'#' * round(own * BAR_WIDTH)}")
+
+
+def folded(traces: List[dict]) -> None:
+    totals: Dict[Stack, float] = defaultdict(float)
+    for trace in traces:
+        for stack, _dur, own in stacks(trace):
+            totals[stack] += own
+    for stack, own in sorted(totals.items()):
+        if own >= 0.001:
+            print(f"{';'.join(stack)} {round(own * 1000)}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--file", type=Path, default=None, help="trace file (default: TRACE_FILE)")
+    parser.add_argument("--name", default="", help="only traces of this request name (e.g. analyze)")
+    parser.add_argument("--by", default="", help="group by a trace attribute (e.g. output_source)")
+    parser.add_argument("--folded", action="store_true", help="print folded stacks for flame graph tools")
+    args = parser.parse_args()
+
+    path = args.file or trace_file()
+    if not path.exists():
+        print(f"No trace file at {path} (set TRACE_SAMPLE_RATE > 0 and send some requests)")
+        return 1
+    traces = read_traces(path, args.name)
+    if not traces:
+        print(f"No traces in {path}" + (f" named {args.name!r}" if args.name else ""))
+        return 1
+    if args.folded:
+        folded(traces)
+        return 0
+
+    groups: Dict[str, List[dict]] = defaultdict(list)
+    for trace in traces:
+        groups[str(trace.get("attributes", {}).get(args.by)) if args.by else "all"].append(trace)
+    for group, members in sorted(groups.items(), key=lambda g: -len(g[1])):
+        totals = [t["total_ms"] for t in members]
+        heading = f"{args.by}={group}" if args.by else f"{len(members)} traces from {path.name}"
+        print(f"\n{heading}: {len(members)} requests, total p50 {percentile(totals, 50):.2f} ms, "
+              f"p95 {percentile(totals, 95):.2f} ms, p99 {percentile(totals, 99):.2f} ms\n")
+        summarize(members)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())